@@ -1,10 +1,47 @@
 import adsk.core, adsk.fusion, adsk.cam, traceback
-import random
-import math
+import os
+from ...terrain import heightmap
+from ...terrain import cache
+from ...terrain import mesh
+from ...terrain import tiles
+from ...terrain import parallel
+from ...terrain import importer
+from ...terrain import decimate
+from ...terrain import pipeline
+from ... import config
 
 # Global list to maintain references to event handlers
 handlers = []
 
+# Height maps computed by earlier runs of the command
+heightMapCache = cache.HeightMapCache(
+    config.HEIGHTMAP_CACHE_FOLDER if config.HEIGHTMAP_DISK_CACHE else None,
+    config.HEIGHTMAP_MEMORY_CACHE_MB * 1024 * 1024,
+    config.HEIGHTMAP_DISK_CACHE_MB * 1024 * 1024)
+
+# Generator choices shown in the dialog, mapped to the height map generators
+GENERATORS = {
+    'Perlin Octaves': heightmap.PERLIN,
+    'Diamond-Square': heightmap.DIAMOND_SQUARE,
+}
+
+# Where the height map comes from
+SOURCE_PROCEDURAL = 'Procedural'
+SOURCE_FILE = 'Height Map File'
+
+# Inputs that only apply to procedurally generated height maps
+PROCEDURAL_INPUTS = ('roughness', 'seed', 'generator')
+
+# Ways of turning the height map into geometry
+OUTPUT_LOFT = 'loft'
+OUTPUT_MESH = 'mesh'
+OUTPUT_BREP = 'brep'
+OUTPUT_MODES = {
+    'Lofted Solid': OUTPUT_LOFT,
+    'Mesh Body': OUTPUT_MESH,
+    'Mesh Converted to Solid': OUTPUT_BREP,
+}
+
 # Event handler for the command creation event
 class TerrainGeneratorCommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
     def __init__(self):
@@ -18,12 +55,24 @@ class TerrainGeneratorCommandCreatedHandler(adsk.core.CommandCreatedEventHandler
             # Get the CommandInputs collection to create command inputs
             inputs = cmd.commandInputs
             
+            # Create a drop down to choose between a generated and an imported height map
+            sourceInput = inputs.addDropDownCommandInput('source', 'Source', adsk.core.DropDownStyles.TextListDropDownStyle)
+            sourceInput.listItems.add(SOURCE_PROCEDURAL, True)
+            sourceInput.listItems.add(SOURCE_FILE, False)
+            
+            # Elevation raster to import, picked with the browse button
+            importFileInput = inputs.addStringValueInput('importFile', 'Height Map File', '')
+            importFileInput.isReadOnly = True
+            importFileInput.isVisible = False
+            browseInput = inputs.addBoolValueInput('browseFile', 'Browse...', False, '', False)
+            browseInput.isVisible = False
+            
             # Create value inputs for terrain parameters
             inputs.addValueInput('terrainSize', 'Terrain Size', 'mm', adsk.core.ValueInput.createByReal(100))
             inputs.addValueInput('heightScale', 'Height Scale', 'mm', adsk.core.ValueInput.createByReal(10))
             
             # Create slider inputs for terrain parameters
-            detailLevelInput = inputs.addIntegerSliderCommandInput('detailLevel', 'Detail Level', 1, 6)
+            detailLevelInput = inputs.addIntegerSliderCommandInput('detailLevel', 'Detail Level', 1, config.MAX_DETAIL_LEVEL)
             detailLevelInput.valueOne = 4
             
             roughnessInput = inputs.addIntegerSliderCommandInput('roughness', 'Roughness', 1, 10)
@@ -31,16 +80,125 @@ class TerrainGeneratorCommandCreatedHandler(adsk.core.CommandCreatedEventHandler
             
             seedInput = inputs.addIntegerSpinnerCommandInput('seed', 'Random Seed', 0, 10000, 1, 42)
             
+            # Create a drop down to choose the height map generator
+            generatorInput = inputs.addDropDownCommandInput('generator', 'Generator', adsk.core.DropDownStyles.TextListDropDownStyle)
+            for name in GENERATORS:
+                generatorInput.listItems.add(name, name == 'Perlin Octaves')
+            
+            # Erosion passes applied to the height map; zero skips a pass
+            inputs.addIntegerSpinnerCommandInput('thermalIterations', 'Thermal Erosion', 0, 500, 10, 0)
+            inputs.addIntegerSpinnerCommandInput('hydraulicIterations', 'Hydraulic Erosion', 0, 500, 10, 0)
+            
+            # Create a drop down to choose how the terrain geometry is built
+            outputInput = inputs.addDropDownCommandInput('outputMode', 'Output', adsk.core.DropDownStyles.TextListDropDownStyle)
+            for name in OUTPUT_MODES:
+                outputInput.listItems.add(name, name == 'Lofted Solid')
+            
+            # Maximum vertical error of the adaptive mesh; zero keeps every grid point
+            inputs.addValueInput('maxError', 'Max Mesh Error', 'mm', adsk.core.ValueInput.createByReal(0))
+            
+            # Maximum vertical error of the lofted splines; points within it of a straight line are dropped
+            inputs.addValueInput('loftTolerance', 'Loft Tolerance', 'mm', adsk.core.ValueInput.createByReal(0.01))
+            
+            # Optionally write the terrain to an STL or OBJ file as well
+            inputs.addBoolValueInput('exportFile', 'Export STL/OBJ', True, '', False)
+            
+            # Connect to the input changed event to switch sources and browse for files
+            onInputChanged = TerrainGeneratorCommandInputChangedHandler()
+            cmd.inputChanged.add(onInputChanged)
+            handlers.append(onInputChanged)
+            
             # Connect to the execute event
             onExecute = TerrainGeneratorCommandExecuteHandler()
             cmd.execute.add(onExecute)
             handlers.append(onExecute)
             
+            # Connect to the execute preview event to draw a coarse terrain while the dialog is open
+            onExecutePreview = TerrainGeneratorCommandExecutePreviewHandler()
+            cmd.executePreview.add(onExecutePreview)
+            handlers.append(onExecutePreview)
+            
         except:
             app = adsk.core.Application.get()
             ui = app.userInterface
             ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
 
+# Event handler for the command input changed event
+class TerrainGeneratorCommandInputChangedHandler(adsk.core.InputChangedEventHandler):
+    def __init__(self):
+        super().__init__()
+    
+    def notify(self, args):
+        try:
+            inputs = args.inputs
+            changedInput = args.input
+            
+            if changedInput.id == 'source':
+                # Show the file inputs or the generator inputs for the chosen source
+                importing = changedInput.selectedItem.name == SOURCE_FILE
+                inputs.itemById('importFile').isVisible = importing
+                inputs.itemById('browseFile').isVisible = importing
+                for inputId in PROCEDURAL_INPUTS:
+                    inputs.itemById(inputId).isVisible = not importing
+            
+            elif changedInput.id == 'browseFile':
+                ui = adsk.core.Application.get().userInterface
+                fileDialog = ui.createFileDialog()
+                fileDialog.title = 'Import Height Map'
+                fileDialog.filter = 'Height Maps ({});;All Files (*.*)'.format(
+                    ' '.join('*' + extension for extension in importer.SUPPORTED_EXTENSIONS))
+                if fileDialog.showOpen() == adsk.core.DialogResults.DialogOK:
+                    inputs.itemById('importFile').value = fileDialog.filename
+            
+        except:
+            app = adsk.core.Application.get()
+            ui = app.userInterface
+            ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+
+# Event handler for the command execute preview event
+class TerrainGeneratorCommandExecutePreviewHandler(adsk.core.CommandEventHandler):
+    def __init__(self):
+        super().__init__()
+    
+    def notify(self, args):
+        try:
+            inputs = args.command.commandInputs
+            
+            # Get the input values; the preview never goes above the preview detail level
+            terrainSize = inputs.itemById('terrainSize').value
+            heightScale = inputs.itemById('heightScale').value
+            detailLevel = min(inputs.itemById('detailLevel').valueOne, config.PREVIEW_DETAIL_LEVEL)
+            roughness = inputs.itemById('roughness').valueOne
+            seed = inputs.itemById('seed').value
+            generator = GENERATORS[inputs.itemById('generator').selectedItem.name]
+            erosionIterations = (inputs.itemById('thermalIterations').value, inputs.itemById('hydraulicIterations').value)
+            importFile = _importFile(inputs)
+            if importFile == '':
+                return
+            
+            # The coarse map comes from the cache, so changing only the height
+            # scale or terrain size just rescales it
+            numVertices = heightmap.gridSize(detailLevel)
+            if importFile:
+                heightMap = heightMapCache.getImportedHeightMap(importFile, numVertices, heightScale, *erosionIterations)
+            else:
+                heightMap = heightMapCache.getHeightMap(numVertices, heightScale, roughness, seed, generator, *erosionIterations)
+            terrainMesh = pipeline.buildMesh(heightMap, terrainSize, heightScale)
+            
+            # Draw it as custom graphics, which Fusion removes when the preview ends
+            design = adsk.fusion.Design.cast(adsk.core.Application.get().activeProduct)
+            graphics = design.rootComponent.customGraphicsGroups.add()
+            coordinates = adsk.fusion.CustomGraphicsCoordinates.create(terrainMesh.flatCoordinates())
+            indices = terrainMesh.flatIndices()
+            graphics.addMesh(coordinates, indices, terrainMesh.flatVertexNormals(), indices)
+            
+            # Leave the result invalid so the full terrain is built on OK
+            args.isValidResult = False
+            
+        except:
+            app = adsk.core.Application.get()
+            app.log('Terrain preview failed:\n{}'.format(traceback.format_exc()))
+
 # Event handler for the command execution event
 class TerrainGeneratorCommandExecuteHandler(adsk.core.CommandEventHandler):
     def __init__(self):
@@ -57,12 +215,20 @@ class TerrainGeneratorCommandExecuteHandler(adsk.core.CommandEventHandler):
             detailLevel = inputs.itemById('detailLevel').valueOne
             roughness = inputs.itemById('roughness').valueOne
             seed = inputs.itemById('seed').value
+            generator = GENERATORS[inputs.itemById('generator').selectedItem.name]
+            erosionIterations = (inputs.itemById('thermalIterations').value, inputs.itemById('hydraulicIterations').value)
+            outputMode = OUTPUT_MODES[inputs.itemById('outputMode').selectedItem.name]
+            maxError = inputs.itemById('maxError').value
+            loftTolerance = inputs.itemById('loftTolerance').value
+            exportFile = inputs.itemById('exportFile').value
+            importFile = _importFile(inputs)
             
-            # Set the random seed for reproducible terrain
-            random.seed(seed)
+            app = adsk.core.Application.get()
+            if importFile == '':
+                app.userInterface.messageBox('Choose a height map file to import.')
+                return
             
             # Get the active design
-            app = adsk.core.Application.get()
             design = app.activeProduct
             
             # Create a new component for the terrain
@@ -71,20 +237,22 @@ class TerrainGeneratorCommandExecuteHandler(adsk.core.CommandEventHandler):
             terrainComp.name = 'Bryce Terrain'
             
             # Generate the terrain mesh
-            self._generateTerrain(terrainComp, terrainSize, heightScale, detailLevel, roughness)
+            self._generateTerrain(terrainComp, terrainSize, heightScale, detailLevel, roughness, seed, generator, erosionIterations,
+                                  outputMode, maxError, exportFile, importFile, loftTolerance)
             
         except:
             app = adsk.core.Application.get()
             ui = app.userInterface
             ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
     
-    def _generateTerrain(self, component, size, heightScale, detailLevel, roughness):
+    def _generateTerrain(self, component, size, heightScale, detailLevel, roughness, seed, generator, erosionIterations,
+                         outputMode, maxError, exportFile, importFile=None, loftTolerance=0):
         try:
             app = adsk.core.Application.get()
             ui = app.userInterface
             
             # Calculate the number of vertices based on detail level
-            numVertices = int(math.pow(2, detailLevel) + 1)
+            numVertices = heightmap.gridSize(detailLevel)
             
             # Progress dialog
             progressDialog = ui.createProgressDialog()
@@ -93,96 +261,48 @@ class TerrainGeneratorCommandExecuteHandler(adsk.core.CommandEventHandler):
             progressDialog.isCancelButtonShown = True
             progressDialog.show('Terrain Generator', 'Generating height map...', 0, numVertices)
             
-            # Generate height map
-            heightMap = []
-            for i in range(numVertices):
-                if progressDialog.wasCancelled:
+            tiledMap = None
+            if importFile:
+                # Imported rasters are resampled to the grid in one pass
+                if detailLevel > config.MAX_IN_MEMORY_DETAIL_LEVEL:
+                    raise ValueError('Imported height maps are limited to detail level {}.'.format(
+                        config.MAX_IN_MEMORY_DETAIL_LEVEL))
+                heightMap = heightMapCache.getImportedHeightMap(importFile, numVertices, heightScale, *erosionIterations)
+            elif detailLevel > config.MAX_IN_MEMORY_DETAIL_LEVEL:
+                # Very large terrains are generated tile by tile into a memory-mapped file
+                tiledMap = self._generateTiledHeightMap(numVertices, roughness, seed, generator,
+                                                        erosionIterations, progressDialog)
+                if tiledMap is None:
                     progressDialog.hide()
+                    ui.messageBox('Terrain generation was cancelled. Run it again with the same settings to resume.')
                     return
-                    
-                progressDialog.progressValue = i
-                
-                row = []
-                for j in range(numVertices):
-                    x = (j / (numVertices - 1)) * size
-                    y = (i / (numVertices - 1)) * size
-                    z = self._generateHeight(x, y, size, heightScale, roughness)
-                    row.append(z)
-                heightMap.append(row)
+                heightMap = tiledMap.open(heightScale)
+            else:
+                # Generate height map for the whole grid in one pass, or reuse it from an earlier run
+                heightMap = heightMapCache.getHeightMap(numVertices, heightScale, roughness, seed, generator, *erosionIterations)
             
             progressDialog.progressMessage = 'Creating terrain...'
             progressDialog.progressValue = 0
             
-            # Create the terrain using built-in spline-based loft
-            # Create a new sketch for each row of points
-            sketches = []
-            splines = []
-            
-            for i in range(numVertices):
-                if progressDialog.wasCancelled:
+            terrainMesh = None
+            if tiledMap:
+                # Lofts and solids are impractical at this size; add one mesh body per tile
+                self._createTiledMeshBodies(component, tiledMap, size, heightScale, progressDialog)
+                maxError = 0
+                summary = '{} x {} grid points in {} mesh bodies'.format(numVertices, numVertices, tiledMap.tileCount)
+            elif outputMode == OUTPUT_LOFT:
+                loftSize = self._createLoftedBody(component, heightMap, size, heightScale, loftTolerance, progressDialog)
+                if not loftSize:
                     progressDialog.hide()
                     return
-                    
-                progressDialog.progressValue = i
-                
-                # Create a sketch for this row
-                sketch = component.sketches.add(component.xZConstructionPlane)
-                sketches.append(sketch)
-                
-                # Create points for this row
-                points = adsk.core.ObjectCollection.create()
-                for j in range(numVertices):
-                    x = (j / (numVertices - 1)) * size
-                    y = (i / (numVertices - 1)) * size
-                    z = heightMap[i][j]
-                    points.add(adsk.core.Point3D.create(x, z, y))  # Note: Y and Z are swapped due to sketch orientation
-                
-                # Create a spline through the points
-                spline = sketch.sketchCurves.sketchFittedSplines.add(points)
-                splines.append(spline)
-            
-            # Create a loft feature
-            loftFeats = component.features.loftFeatures
-            
-            # Create a loft input
-            loftInput = loftFeats.createInput(adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
-            
-            # Add all profiles to the loft
-            for spline in splines:
-                loftInput.loftSections.add(spline)
-            
-            # Set loft options
-            loftInput.isSolid = False  # Create a surface
-            
-            # Create the loft
-            loftFeat = loftFeats.add(loftInput)
-            
-            # Use thickening with correct parameters
-            thickenFeatures = component.features.thickenFeatures
-            
-            # Create a collection of the faces to thicken
-            facesToThicken = adsk.core.ObjectCollection.create()
-            for face in loftFeat.bodies.item(0).faces:
-                facesToThicken.add(face)
-            
-            # Create the thicken input with the correct parameters
-            thickness = adsk.core.ValueInput.createByReal(heightScale * 0.01)
-            thickenInput = thickenFeatures.createInput(facesToThicken, thickness, False, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
-            
-            # Create the thickened solid
-            thickenFeature = thickenFeatures.add(thickenInput)
-            
-            # Rename the body
-            if thickenFeature.bodies.count > 0:
-                terrainBody = thickenFeature.bodies.item(0)
-                terrainBody.name = 'Bryce Terrain'
-            
-            # Hide the original surface
-            loftFeat.bodies.item(0).isLightBulbOn = False
-            
-            # Hide all sketches in the component
-            for sketch in sketches:
-                sketch.isVisible = False
+                summary = '{} x {} grid points lofted through {} x {}'.format(numVertices, numVertices, *loftSize)
+            else:
+                terrainMesh = pipeline.buildMesh(heightMap, size, heightScale, maxError)
+                if outputMode == OUTPUT_MESH:
+                    self._createMeshBody(component, terrainMesh)
+                else:
+                    self._createBRepBody(component, terrainMesh)
+                summary = '{} x {} grid points, {} triangles'.format(numVertices, numVertices, terrainMesh.triangleCount)
             
             # Hide construction geometry
             component.isConstructionFolderLightBulbOn = False
@@ -192,72 +312,242 @@ class TerrainGeneratorCommandExecuteHandler(adsk.core.CommandEventHandler):
             
             progressDialog.hide()
             
-            ui.messageBox('Terrain generated with size: {} mm, {} x {} grid points.'.format(
-                size, numVertices, numVertices))
+            if exportFile:
+                exportPath = self._exportTerrain(heightMap, size, heightScale, maxError, terrainMesh)
+                if exportPath:
+                    summary += ', exported to {}'.format(exportPath)
+            
+            ui.messageBox('Terrain generated with size: {} mm, {}.'.format(size, summary))
             
         except Exception as e:
             app = adsk.core.Application.get()
             ui = app.userInterface
             progressDialog.hide() if 'progressDialog' in locals() else None
             ui.messageBox('Error in _generateTerrain: {}'.format(str(e)))
+    
+    def _createLoftedBody(self, component, heightMap, size, heightScale, tolerance, progressDialog):
+        # Loft a fitted spline per height map row into a surface and thicken it.
+        # Rows and columns within tolerance of their neighbours are dropped first;
+        # every spline uses the same columns so the sections stay compatible.
+        # Returns the number of sections and points per section, or None if the user cancelled.
+        numVertices = len(heightMap)
+        columns = decimate.loftStations(heightMap, tolerance)
+        rows = decimate.loftStations([[heightMap[i][j] for i in range(numVertices)] for j in columns], tolerance)
+        progressDialog.maximumValue = len(rows)
+        
+        # Create the terrain using built-in spline-based loft
+        # Create a new sketch for each row of points
+        sketches = []
+        splines = []
+        
+        for section, i in enumerate(rows):
+            if progressDialog.wasCancelled:
+                return None
+                
+            progressDialog.progressValue = section
+            
+            # Create a sketch for this row
+            sketch = component.sketches.add(component.xZConstructionPlane)
+            sketches.append(sketch)
+            
+            # Create points for this row
+            points = adsk.core.ObjectCollection.create()
+            for j in columns:
+                x = (j / (numVertices - 1)) * size
+                y = (i / (numVertices - 1)) * size
+                z = heightMap[i][j]
+                points.add(adsk.core.Point3D.create(x, z, y))  # Note: Y and Z are swapped due to sketch orientation
+            
+            # Create a spline through the points
+            spline = sketch.sketchCurves.sketchFittedSplines.add(points)
+            splines.append(spline)
+        
+        # Create a loft feature
+        loftFeats = component.features.loftFeatures
         
-    def _generateHeight(self, x, y, size, heightScale, roughness):
-        # Advanced noise function for terrain generation using multiple octaves
-        noise = 0
-        frequency = 1.0
-        amplitude = 1.0
-        maxValue = 0
+        # Create a loft input
+        loftInput = loftFeats.createInput(adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
         
-        for i in range(roughness):
-            noise += amplitude * self._improvedNoise2D(x * frequency / size, y * frequency / size)
-            maxValue += amplitude
-            frequency *= 2
-            amplitude *= 0.5
+        # Add all profiles to the loft
+        for spline in splines:
+            loftInput.loftSections.add(spline)
         
-        # Normalize the noise to be in range [0, 1]
-        noise = (noise / maxValue + 1) * 0.5
+        # Set loft options
+        loftInput.isSolid = False  # Create a surface
         
-        # Apply height scale
-        return noise * heightScale
+        # Create the loft
+        loftFeat = loftFeats.add(loftInput)
+        
+        # Use thickening with correct parameters
+        thickenFeatures = component.features.thickenFeatures
+        
+        # Create a collection of the faces to thicken
+        facesToThicken = adsk.core.ObjectCollection.create()
+        for face in loftFeat.bodies.item(0).faces:
+            facesToThicken.add(face)
+        
+        # Create the thicken input with the correct parameters
+        thickness = adsk.core.ValueInput.createByReal(heightScale * pipeline.BASE_DEPTH)
+        thickenInput = thickenFeatures.createInput(facesToThicken, thickness, False, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
+        
+        # Create the thickened solid
+        thickenFeature = thickenFeatures.add(thickenInput)
+        
+        # Rename the body
+        if thickenFeature.bodies.count > 0:
+            terrainBody = thickenFeature.bodies.item(0)
+            terrainBody.name = 'Bryce Terrain'
+        
+        # Hide the original surface
+        loftFeat.bodies.item(0).isLightBulbOn = False
+        
+        # Hide all sketches in the component
+        for sketch in sketches:
+            sketch.isVisible = False
+        
+        return len(rows), len(columns)
     
-    def _improvedNoise2D(self, x, y):
-        # Improved noise function with smoothing and interpolation
-        # Get grid cell coordinates
-        x0 = math.floor(x)
-        y0 = math.floor(y)
-        x1 = x0 + 1
-        y1 = y0 + 1
+    def _generateTiledHeightMap(self, numVertices, roughness, seed, generator, erosionIterations, progressDialog):
+        # Fill in (or resume) the unit height tiled map for these parameters, then
+        # erode it into a second tiled map if requested. Returns None if the user
+        # cancelled. Older maps are evicted once the tiles folder is over budget.
+        if generator != heightmap.PERLIN:
+            raise ValueError('Detail levels above {} are only available with Perlin Octaves.'.format(
+                config.MAX_IN_MEMORY_DETAIL_LEVEL))
+        
+        filename = '{}_{}_{}_{}{}'.format(generator, numVertices, roughness, seed, tiles.TILE_FILE_EXTENSION)
+        tiledMap = tiles.TiledHeightMap(os.path.join(config.HEIGHTMAP_TILE_FOLDER, filename), numVertices)
         
-        # Get relative position within cell
-        sx = x - x0
-        sy = y - y0
+        progressDialog.maximumValue = tiledMap.tileCount
         
-        # Smooth interpolation weights
-        sx = self._smoothstep(sx)
-        sy = self._smoothstep(sy)
+        def progress(tilesDone, tileCount):
+            progressDialog.maximumValue = tileCount
+            progressDialog.progressValue = tilesDone
+            adsk.doEvents()
+            return not progressDialog.wasCancelled
         
-        # Get random values for each corner
-        n00 = self._random2D(x0, y0)
-        n01 = self._random2D(x0, y1)
-        n10 = self._random2D(x1, y0)
-        n11 = self._random2D(x1, y1)
+        # Tiles are spread over worker processes and merged into the same file
+        if not parallel.generateTiled(tiledMap, roughness, seed, config.TERRAIN_WORKERS, progress):
+            return None
         
-        # Interpolate
-        nx0 = self._lerp(n00, n10, sx)
-        nx1 = self._lerp(n01, n11, sx)
-        n = self._lerp(nx0, nx1, sy)
+        thermalIterations, hydraulicIterations = erosionIterations
+        if thermalIterations == 0 and hydraulicIterations == 0:
+            self._evictTiledMaps(tiledMap)
+            return tiledMap
         
-        return n * 2 - 1  # Scale to range [-1, 1]
+        progressDialog.progressMessage = 'Eroding terrain...'
+        progressDialog.progressValue = 0
+        erodedName = '{}_t{}_h{}{}'.format(os.path.splitext(filename)[0], thermalIterations, hydraulicIterations,
+                                           tiles.TILE_FILE_EXTENSION)
+        erodedMap = tiles.TiledHeightMap(os.path.join(config.HEIGHTMAP_TILE_FOLDER, erodedName), numVertices)
+        parameters = tiles.generatorParameters(roughness, seed) + [thermalIterations, hydraulicIterations]
+        if not parallel.erodeTiled(erodedMap, tiledMap, parameters, thermalIterations, hydraulicIterations,
+                                   config.TERRAIN_WORKERS, progress):
+            return None
+        self._evictTiledMaps(tiledMap, erodedMap)
+        return erodedMap
     
-    def _random2D(self, x, y):
-        # Generate reproducible random value for a point
-        value = math.sin(x * 12.9898 + y * 78.233) * 43758.5453
-        return value - math.floor(value)
+    def _evictTiledMaps(self, *inUse):
+        # Keep the tiles folder within its budget without touching the maps in use
+        tiles.evictTiledMaps(config.HEIGHTMAP_TILE_FOLDER, config.HEIGHTMAP_TILE_CACHE_MB * 1024 * 1024,
+                             [tiledMap.path for tiledMap in inUse])
     
-    def _smoothstep(self, t):
-        # Smoothstep function for smoother interpolation
-        return t * t * (3 - 2 * t)
+    def _createTiledMeshBodies(self, component, tiledMap, size, heightScale, progressDialog):
+        # Add each tile of a tiled height map as its own surface mesh body
+        design = adsk.fusion.Design.cast(component.parentDesign)
+        baseFeature = None
+        if design.designType == adsk.fusion.DesignTypes.ParametricDesignType:
+            baseFeature = component.features.baseFeatures.add()
+            baseFeature.startEdit()
+        
+        progressDialog.maximumValue = tiledMap.tileCount
+        for tile, tileMesh in enumerate(mesh.tiledGridMeshes(tiledMap, size, heightScale)):
+            progressDialog.progressValue = tile
+            meshBody = component.meshBodies.addByTriangleMeshData(
+                tileMesh.flatCoordinates(), tileMesh.flatIndices(), [], [])
+            meshBody.name = 'Bryce Terrain {}'.format(tile + 1)
+        
+        if baseFeature:
+            baseFeature.finishEdit()
     
-    def _lerp(self, a, b, t):
-        # Linear interpolation
-        return a + t * (b - a) 
\ No newline at end of file
+    def _createMeshBody(self, component, terrainMesh):
+        # Add the triangle mesh as a single mesh body; Fusion computes the normals
+        design = adsk.fusion.Design.cast(component.parentDesign)
+        baseFeature = None
+        if design.designType == adsk.fusion.DesignTypes.ParametricDesignType:
+            baseFeature = component.features.baseFeatures.add()
+            baseFeature.startEdit()
+        
+        meshBody = component.meshBodies.addByTriangleMeshData(
+            terrainMesh.flatCoordinates(), terrainMesh.flatIndices(), [], [])
+        meshBody.name = 'Bryce Terrain'
+        
+        if baseFeature:
+            baseFeature.finishEdit()
+        return meshBody
+    
+    def _createBRepBody(self, component, terrainMesh):
+        # Convert the triangle mesh into a solid with one planar face per triangle.
+        # Edges are shared between neighbouring faces so the result is watertight.
+        vertices = terrainMesh.vertices
+        points = [adsk.core.Point3D.create(float(x), float(y), float(z)) for x, y, z in vertices]
+        
+        bodyDef = adsk.fusion.BRepBodyDefinition.create()
+        vertexDefs = [bodyDef.createVertexDefinition(point) for point in points]
+        shellDef = bodyDef.lumpDefinitions.add().shellDefinitions.add()
+        edgeDefs = {}
+        
+        for triangle in terrainMesh.triangles:
+            a, b, c = (int(index) for index in triangle)
+            
+            # Face normal from the counter-clockwise winding
+            ab = points[a].vectorTo(points[b])
+            ac = points[a].vectorTo(points[c])
+            normal = ab.crossProduct(ac)
+            normal.normalize()
+            faceDef = shellDef.faceDefinitions.add(adsk.core.Plane.create(points[a], normal), False)
+            loopDef = faceDef.loopDefinitions.add()
+            
+            for start, end in ((a, b), (b, c), (c, a)):
+                key = (min(start, end), max(start, end))
+                edgeDef = edgeDefs.get(key)
+                if edgeDef is None:
+                    line = adsk.core.Line3D.create(points[key[0]], points[key[1]])
+                    edgeDef = bodyDef.createEdgeDefinitionByCurve(vertexDefs[key[0]], vertexDefs[key[1]], line)
+                    edgeDefs[key] = edgeDef
+                loopDef.bRepCoEdgeDefinitions.add(edgeDef, start != key[0])
+        
+        body = bodyDef.createBody()
+        
+        design = adsk.fusion.Design.cast(component.parentDesign)
+        if design.designType == adsk.fusion.DesignTypes.ParametricDesignType:
+            baseFeature = component.features.baseFeatures.add()
+            baseFeature.startEdit()
+            terrainBody = component.bRepBodies.add(body, baseFeature)
+            baseFeature.finishEdit()
+        else:
+            terrainBody = component.bRepBodies.add(body)
+        terrainBody.name = 'Bryce Terrain'
+        return terrainBody
+    
+    def _exportTerrain(self, heightMap, size, heightScale, maxError, terrainMesh):
+        # Ask for a file name and write the closed terrain as STL or OBJ in mm.
+        # The full grid is streamed unless an adaptive mesh was requested.
+        ui = adsk.core.Application.get().userInterface
+        fileDialog = ui.createFileDialog()
+        fileDialog.title = 'Export Terrain'
+        fileDialog.filter = 'STL Files (*.stl);;OBJ Files (*.obj)'
+        fileDialog.initialFilename = 'Bryce Terrain.stl'
+        if fileDialog.showSave() != adsk.core.DialogResults.DialogOK:
+            return None
+        
+        # Fusion's internal length unit is cm
+        pipeline.writeMesh(fileDialog.filename, heightMap, size, heightScale, maxError, terrainMesh, scale=10.0)
+        return fileDialog.filename
+
+def _importFile(inputs):
+    # Path of the height map to import, '' if importing but no file is chosen yet,
+    # or None for procedural terrain
+    if inputs.itemById('source').selectedItem.name != SOURCE_FILE:
+        return None
+    return inputs.itemById('importFile').value
@@ -18,4 +18,29 @@ ADDIN_NAME = os.path.basename(os.path.dirname(__file__))
 COMPANY_NAME = 'ACME'
 
 # Palettes
-sample_palette_id = f'{COMPANY_NAME}_{ADDIN_NAME}_palette_id'
\ No newline at end of file
+sample_palette_id = f'{COMPANY_NAME}_{ADDIN_NAME}_palette_id'
+
+# Height map cache used by the terrain generator. Height maps are kept in memory
+# and, if enabled, written to the cache folder inside the add-in.
+HEIGHTMAP_DISK_CACHE = True
+HEIGHTMAP_CACHE_FOLDER = os.path.join(os.path.dirname(__file__), 'cache', 'heightmaps')
+HEIGHTMAP_MEMORY_CACHE_MB = 64
+HEIGHTMAP_DISK_CACHE_MB = 256
+
+# Detail levels above this are generated tile by tile into a memory-mapped file in
+# the tiles folder instead of in memory. Interrupted generation resumes from the
+# last finished tile the next time the same terrain is requested.
+MAX_IN_MEMORY_DETAIL_LEVEL = 8
+MAX_DETAIL_LEVEL = 12
+HEIGHTMAP_TILE_FOLDER = os.path.join(os.path.dirname(__file__), 'cache', 'tiles')
+
+# Least recently used tiled maps are deleted once the tiles folder grows past
+# this size. A detail level 12 map takes about 67 MB, plus as much per eroded variant.
+HEIGHTMAP_TILE_CACHE_MB = 1024
+
+# Number of worker processes for tiled terrain generation; 0 uses all but one core
+TERRAIN_WORKERS = 0
+
+# Detail level of the coarse terrain drawn while the Terrain Generator dialog is
+# open (4 gives a 17 x 17 grid). The full terrain is only built on OK.
+PREVIEW_DETAIL_LEVEL = 4
@@ -0,0 +1,2 @@
+# This file makes the terrain directory a Python package.
+# Nothing in this package imports adsk so it can also be used from a plain Python process.
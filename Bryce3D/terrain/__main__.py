@@ -0,0 +1,6 @@
+# Entry point for "python -m terrain"; see terrain.cli for the options.
+import sys
+
+from .cli import main
+
+sys.exit(main())
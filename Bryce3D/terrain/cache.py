@@ -0,0 +1,205 @@
+"""Cache for generated height maps.
+
+Height maps are cached at unit height scale, keyed by the parameters that
+actually change the heights (generator, grid size, roughness, seed, erosion
+iterations) plus the generator version. The terrain size does not affect the heights, and the
+height scale is applied when a cached map is handed out, so resizing or
+rescaling a terrain never regenerates it.
+
+Entries are kept as compact float32 arrays in an in-memory LRU and, when a
+directory is given, as raw little-endian float32 files on disk. Both levels
+evict least recently used entries once their byte budget is exceeded.
+
+Height maps imported from files are cached in memory only, keyed by the
+file's path, size and modification time, so editing the file re-imports it.
+"""
+
+import array
+import os
+import sys
+from collections import OrderedDict
+
+from . import heightmap
+from . import erosion
+from . import importer
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# File extension of the on-disk cache entries
+CACHE_FILE_EXTENSION = '.f32'
+
+
+def cacheKey(numVertices, roughness, seed, generator, thermalIterations=0, hydraulicIterations=0):
+    # Normalized key for a unit height map
+    return (str(generator), int(numVertices), int(roughness), int(seed),
+            int(thermalIterations), int(hydraulicIterations), heightmap.GENERATOR_VERSION)
+
+
+class HeightMapCache:
+    def __init__(self, directory=None, maxMemoryBytes=64 * 1024 * 1024, maxDiskBytes=256 * 1024 * 1024):
+        # directory is optional; without it only the in-memory LRU is used
+        self.directory = directory
+        self.maxMemoryBytes = maxMemoryBytes
+        self.maxDiskBytes = maxDiskBytes
+        self._entries = OrderedDict()
+        self._memoryBytes = 0
+
+    def getHeightMap(self, numVertices, heightScale, roughness, seed, generator=heightmap.PERLIN,
+                     thermalIterations=0, hydraulicIterations=0):
+        # Same result as heightmap.generateHeightMap followed by erosion.erode,
+        # computed at most once per key
+        key = cacheKey(numVertices, roughness, seed, generator, thermalIterations, hydraulicIterations)
+        unitMap = self._load(key, numVertices)
+        if unitMap is None:
+            unitMap = heightmap.generateHeightMap(numVertices, 1.0, roughness, seed, generator)
+            if thermalIterations > 0 or hydraulicIterations > 0:
+                unitMap = erosion.erode(unitMap, thermalIterations, hydraulicIterations)
+            unitMap = _pack(unitMap)
+            self._remember(key, unitMap)
+            self._writeFile(key, unitMap)
+        return _unpack(unitMap, numVertices, heightScale)
+
+    def getImportedHeightMap(self, path, numVertices, heightScale, thermalIterations=0, hydraulicIterations=0):
+        # Same result as importer.importHeightMap followed by erosion.erode
+        status = os.stat(path)
+        key = ('import', os.path.abspath(path), status.st_size, status.st_mtime_ns, int(numVertices),
+               int(thermalIterations), int(hydraulicIterations), heightmap.GENERATOR_VERSION)
+        unitMap = self._entries.get(key)
+        if unitMap is None:
+            unitMap = importer.importHeightMap(path, numVertices, 1.0)
+            if thermalIterations > 0 or hydraulicIterations > 0:
+                unitMap = erosion.erode(unitMap, thermalIterations, hydraulicIterations)
+            unitMap = _pack(unitMap)
+            self._remember(key, unitMap)
+        else:
+            self._entries.move_to_end(key)
+        return _unpack(unitMap, numVertices, heightScale)
+
+    def clear(self):
+        # Drop all in-memory and on-disk entries
+        self._entries.clear()
+        self._memoryBytes = 0
+        for path in self._cacheFiles():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _load(self, key, numVertices):
+        unitMap = self._entries.get(key)
+        if unitMap is not None:
+            self._entries.move_to_end(key)
+            return unitMap
+
+        unitMap = self._readFile(key, numVertices)
+        if unitMap is not None:
+            self._remember(key, unitMap)
+        return unitMap
+
+    def _remember(self, key, unitMap):
+        self._entries[key] = unitMap
+        self._memoryBytes += _byteSize(unitMap)
+        while self._memoryBytes > self.maxMemoryBytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._memoryBytes -= _byteSize(evicted)
+
+    def _filePath(self, key):
+        generator, numVertices, roughness, seed, thermalIterations, hydraulicIterations, version = key
+        filename = '{}_{}_{}_{}_t{}_h{}_v{}{}'.format(generator, numVertices, roughness, seed,
+                                                      thermalIterations, hydraulicIterations, version, CACHE_FILE_EXTENSION)
+        return os.path.join(self.directory, filename)
+
+    def _cacheFiles(self):
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                if name.endswith(CACHE_FILE_EXTENSION)]
+
+    def _readFile(self, key, numVertices):
+        if not self.directory:
+            return None
+        path = self._filePath(key)
+        count = numVertices * numVertices
+        try:
+            if os.path.getsize(path) != count * 4:
+                return None
+            if np is not None:
+                unitMap = np.fromfile(path, dtype='<f4')
+            else:
+                unitMap = array.array('f')
+                with open(path, 'rb') as cacheFile:
+                    unitMap.fromfile(cacheFile, count)
+                if sys.byteorder == 'big':
+                    unitMap.byteswap()
+            # Mark the file as recently used for eviction
+            os.utime(path)
+        except OSError:
+            return None
+        return unitMap
+
+    def _writeFile(self, key, unitMap):
+        if not self.directory:
+            return
+        path = self._filePath(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tempPath = path + '.tmp'
+            with open(tempPath, 'wb') as cacheFile:
+                if np is not None:
+                    unitMap.astype('<f4', copy=False).tofile(cacheFile)
+                elif sys.byteorder == 'big':
+                    swapped = array.array('f', unitMap)
+                    swapped.byteswap()
+                    swapped.tofile(cacheFile)
+                else:
+                    unitMap.tofile(cacheFile)
+            os.replace(tempPath, path)
+            self._evictFiles()
+        except OSError:
+            # The disk cache is only an optimization
+            pass
+
+    def _evictFiles(self):
+        files = []
+        for path in self._cacheFiles():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        totalBytes = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if totalBytes <= self.maxDiskBytes:
+                break
+            try:
+                os.remove(path)
+                totalBytes -= size
+            except OSError:
+                pass
+
+
+def _pack(heightMap):
+    # Flat float32 storage for a height map
+    if np is not None:
+        return np.asarray(heightMap, dtype=np.float32).reshape(-1)
+    return array.array('f', (value for row in heightMap for value in row))
+
+
+def _unpack(unitMap, numVertices, heightScale):
+    # Fresh height map scaled to heightScale; callers are free to modify it
+    if np is not None:
+        heights = unitMap.reshape(numVertices, numVertices).astype(np.float64)
+        heights *= heightScale
+        return heights
+    return [[value * heightScale for value in unitMap[i * numVertices:(i + 1) * numVertices]]
+            for i in range(numVertices)]
+
+
+def _byteSize(unitMap):
+    if np is not None:
+        return unitMap.nbytes
+    return len(unitMap) * unitMap.itemsize
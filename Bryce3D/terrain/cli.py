@@ -0,0 +1,162 @@
+"""Command line terrain generation and benchmarking.
+
+Run from the Bryce3D folder:
+
+    python -m terrain --detail 4 6 8 --seeds 1 2 3 4 --output baked --format stl
+
+Every combination of detail level, seed and roughness is one job. Jobs run on
+a pool of worker processes, each writes its height map and/or mesh to the
+output folder, and a benchmark table with per-stage timings, vertex
+throughput and peak traced memory per detail level is printed at the end.
+Lengths are in mm.
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import heightmap
+from . import parallel
+from . import pipeline
+
+# Stages reported in the benchmark table, in pipeline order
+STAGES = ('generate', 'erode', 'mesh', 'write')
+
+GENERATORS = {
+    'perlin': heightmap.PERLIN,
+    'diamond-square': heightmap.DIAMOND_SQUARE,
+}
+
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(prog='python -m terrain', description='Generate and benchmark Bryce3D terrains.')
+    parser.add_argument('--detail', type=int, nargs='+', default=[4, 6, 8], help='detail levels (grid is 2^level + 1)')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[42], help='random seeds')
+    parser.add_argument('--roughness', type=int, nargs='+', default=[5], help='roughness values, 1 to 10')
+    parser.add_argument('--generator', choices=sorted(GENERATORS), default='perlin')
+    parser.add_argument('--thermal', type=int, default=0, help='thermal erosion iterations')
+    parser.add_argument('--hydraulic', type=int, default=0, help='hydraulic erosion iterations')
+    parser.add_argument('--size', type=float, default=100.0, help='terrain size in mm')
+    parser.add_argument('--height-scale', type=float, default=10.0, help='height scale in mm')
+    parser.add_argument('--max-error', type=float, default=0.0, help='adaptive mesh error in mm, 0 keeps every grid point')
+    parser.add_argument('--format', choices=['stl', 'obj', 'none'], default='none', help='mesh file format')
+    parser.add_argument('--heightmaps', action='store_true', help='also write raw float32 height maps')
+    parser.add_argument('--output', default='terrains', help='output folder')
+    parser.add_argument('--workers', type=int, default=parallel.defaultWorkerCount(), help='worker processes')
+    return parser.parse_args(argv)
+
+
+def makeJobs(arguments):
+    # One job per detail level, roughness and seed
+    jobs = []
+    for detailLevel in arguments.detail:
+        for roughness in arguments.roughness:
+            for seed in arguments.seeds:
+                baseName = '{}_d{}_r{}_s{}'.format(arguments.generator, detailLevel, roughness, seed)
+                jobs.append({
+                    'detailLevel': detailLevel,
+                    'roughness': roughness,
+                    'seed': seed,
+                    'generator': GENERATORS[arguments.generator],
+                    'thermalIterations': arguments.thermal,
+                    'hydraulicIterations': arguments.hydraulic,
+                    'size': arguments.size,
+                    'heightScale': arguments.height_scale,
+                    'maxError': arguments.max_error,
+                    'meshPath': None if arguments.format == 'none' else
+                    os.path.join(arguments.output, '{}.{}'.format(baseName, arguments.format)),
+                    'heightMapPath': os.path.join(arguments.output, baseName + '.f32') if arguments.heightmaps else None,
+                })
+    return jobs
+
+
+def runJob(job):
+    # Run the pipeline for one job and return its statistics
+    timings = {}
+    tracemalloc.start()
+    try:
+        heightMap = pipeline.generateTerrain(job['detailLevel'], job['heightScale'], job['roughness'], job['seed'],
+                                             job['generator'], job['thermalIterations'], job['hydraulicIterations'],
+                                             timings)
+        terrainMesh = pipeline.buildMesh(heightMap, job['size'], job['heightScale'], job['maxError'], timings)
+        if job['heightMapPath']:
+            pipeline.writeHeightMap(job['heightMapPath'], heightMap, timings)
+        if job['meshPath']:
+            pipeline.writeMesh(job['meshPath'], heightMap, job['size'], job['heightScale'], job['maxError'],
+                               terrainMesh, timings=timings)
+        peakBytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    numVertices = heightmap.gridSize(job['detailLevel'])
+    return {
+        'detailLevel': job['detailLevel'],
+        'vertices': numVertices * numVertices,
+        'triangles': terrainMesh.triangleCount,
+        'timings': timings,
+        'peakBytes': peakBytes,
+    }
+
+
+def runJobs(jobs, workers, report=None):
+    # Run the jobs in parallel, calling report(result) as each one finishes
+    results = []
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            results.append(runJob(job))
+            if report:
+                report(results[-1])
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(runJob, job) for job in jobs]
+        for future in as_completed(futures):
+            results.append(future.result())
+            if report:
+                report(results[-1])
+    return results
+
+
+def benchmarkTable(results):
+    # Rows of per detail level averages, formatted as aligned text
+    header = ['detail', 'grid', 'jobs', 'triangles'] + [stage + ' s' for stage in STAGES] + ['total s', 'Mvert/s', 'peak MB']
+    rows = [header]
+    for detailLevel in sorted({result['detailLevel'] for result in results}):
+        group = [result for result in results if result['detailLevel'] == detailLevel]
+        count = len(group)
+        numVertices = heightmap.gridSize(detailLevel)
+        stageTimes = [sum(result['timings'].get(stage, 0.0) for result in group) / count for stage in STAGES]
+        total = sum(stageTimes)
+        throughput = group[0]['vertices'] / total / 1e6 if total > 0 else float('inf')
+        rows.append([str(detailLevel), '{0}x{0}'.format(numVertices), str(count),
+                     str(sum(result['triangles'] for result in group) // count)] +
+                    ['{:.3f}'.format(seconds) for seconds in stageTimes] +
+                    ['{:.3f}'.format(total), '{:.2f}'.format(throughput),
+                     '{:.1f}'.format(max(result['peakBytes'] for result in group) / (1024 * 1024))])
+
+    widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+    return '\n'.join('  '.join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+def main(argv=None):
+    arguments = parseArguments(sys.argv[1:] if argv is None else argv)
+    if arguments.format != 'none' or arguments.heightmaps:
+        os.makedirs(arguments.output, exist_ok=True)
+
+    jobs = makeJobs(arguments)
+    start = time.perf_counter()
+    done = []
+
+    def report(result):
+        done.append(result)
+        print('{}/{} jobs done'.format(len(done), len(jobs)), file=sys.stderr)
+
+    results = runJobs(jobs, arguments.workers, report)
+    elapsed = time.perf_counter() - start
+
+    print(benchmarkTable(results))
+    print('{} jobs in {:.2f} s on {} worker(s)'.format(len(jobs), elapsed, max(1, min(arguments.workers, len(jobs)))))
+    return 0
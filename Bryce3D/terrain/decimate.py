@@ -0,0 +1,77 @@
+"""Column decimation for lofted terrain.
+
+The loft path fits one spline per height map row, and loft time grows with
+the number of fit points. Douglas-Peucker is run on all rows at once: a
+segment between two kept columns is accepted only when every row stays
+within the tolerance of the straight line between its end points, otherwise
+the column with the largest deviation over all rows is kept and both halves
+are checked again. The result is a single set of stations shared by every
+row, so all splines keep the same layout and the loft sections stay
+compatible.
+
+Deviation is measured vertically, which for a height field on evenly spaced
+columns is the error a viewer sees.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def loftStations(heightMap, tolerance):
+    # Sorted column indices to keep; the first and last columns are always kept
+    numColumns = len(heightMap[0])
+    if tolerance <= 0 or numColumns <= 2:
+        return list(range(numColumns))
+    if np is not None:
+        keep = _keepColumnsNumpy(np.asarray(heightMap, dtype=np.float64), tolerance)
+    else:
+        keep = _keepColumnsPython(heightMap, tolerance)
+    return [j for j in range(numColumns) if keep[j]]
+
+
+def _keepColumnsNumpy(heights, tolerance):
+    numColumns = heights.shape[1]
+    keep = np.zeros(numColumns, dtype=bool)
+    keep[0] = keep[-1] = True
+    segments = [(0, numColumns - 1)]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
+            continue
+        block = heights[:, start:end + 1]
+        blend = np.linspace(0.0, 1.0, end - start + 1)
+        line = block[:, :1] + blend * (block[:, -1:] - block[:, :1])
+        deviation = np.abs(block - line).max(axis=0)
+        worst = int(deviation.argmax())
+        if deviation[worst] > tolerance:
+            split = start + worst
+            keep[split] = True
+            segments.append((start, split))
+            segments.append((split, end))
+    return keep
+
+
+def _keepColumnsPython(heightMap, tolerance):
+    numColumns = len(heightMap[0])
+    keep = [False] * numColumns
+    keep[0] = keep[-1] = True
+    segments = [(0, numColumns - 1)]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
+            continue
+        span = end - start
+        worst, worstDeviation = start, 0.0
+        for row in heightMap:
+            first, last = row[start], row[end]
+            for j in range(start + 1, end):
+                deviation = abs(row[j] - (first + (last - first) * (j - start) / span))
+                if deviation > worstDeviation:
+                    worst, worstDeviation = j, deviation
+        if worstDeviation > tolerance:
+            keep[worst] = True
+            segments.append((start, worst))
+            segments.append((worst, end))
+    return keep
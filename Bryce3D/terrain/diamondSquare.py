@@ -0,0 +1,143 @@
+"""Diamond-square (midpoint displacement) height maps.
+
+The terrain grid is 2^detailLevel + 1 vertices wide, which is exactly the shape
+diamond-square needs. Each level of the algorithm is computed with a handful of
+strided array operations, so the whole map is built in O(N^2) without the
+per-octave resampling of the Perlin path.
+
+Random displacements are drawn from random.Random(seed) in the same order by the
+NumPy and pure Python paths, so both produce the same terrain for a seed.
+"""
+
+import random
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def persistence(roughness):
+    # Amplitude ratio between successive levels. Roughness 5 gives the classic
+    # 1/2 ratio; higher roughness keeps more of the fine detail.
+    return 0.25 + 0.05 * roughness
+
+
+def generateHeightMap(numVertices, heightScale, roughness, seed):
+    # Diamond-square height map with values in [0, heightScale].
+    # Returns a 2D NumPy array when NumPy is available and a list of row lists otherwise.
+    if np is not None:
+        return _generateNumpy(numVertices, heightScale, roughness, seed)
+    return _generatePython(numVertices, heightScale, roughness, seed)
+
+
+def _generateNumpy(numVertices, heightScale, roughness, seed):
+    rng = random.Random(seed)
+    heights = np.zeros((numVertices, numVertices), dtype=np.float64)
+    last = numVertices - 1
+
+    heights[0, 0], heights[0, last], heights[last, 0], heights[last, last] = _displacements(rng, 4, 1.0)
+
+    amplitude = persistence(roughness)
+    step = last
+    while step > 1:
+        half = step // 2
+
+        # Diamond step: cell centers are the average of the four cell corners
+        corners = heights[0:-1:step, 0:-1:step] + heights[0:-1:step, step::step] \
+            + heights[step::step, 0:-1:step] + heights[step::step, step::step]
+        centers = corners * 0.25
+        centers += _displacements(rng, centers.size, amplitude).reshape(centers.shape)
+        heights[half::step, half::step] = centers
+
+        # Square step: edge midpoints are the average of their diamond neighbours.
+        # Midpoints on horizontal edges first, then on vertical edges.
+        total = heights[0::step, 0:-1:step] + heights[0::step, step::step]
+        count = np.full(total.shape, 2.0)
+        total[1:] += centers
+        count[1:] += 1
+        total[:-1] += centers
+        count[:-1] += 1
+        total /= count
+        total += _displacements(rng, total.size, amplitude).reshape(total.shape)
+        heights[0::step, half::step] = total
+
+        total = heights[0:-1:step, 0::step] + heights[step::step, 0::step]
+        count = np.full(total.shape, 2.0)
+        total[:, 1:] += centers
+        count[:, 1:] += 1
+        total[:, :-1] += centers
+        count[:, :-1] += 1
+        total /= count
+        total += _displacements(rng, total.size, amplitude).reshape(total.shape)
+        heights[half::step, 0::step] = total
+
+        amplitude *= persistence(roughness)
+        step = half
+
+    # Normalize to [0, 1] and apply the height scale
+    low = heights.min()
+    span = heights.max() - low
+    heights -= low
+    if span > 0:
+        heights *= heightScale / span
+    return heights
+
+
+def _displacements(rng, count, amplitude):
+    return np.array([(rng.random() * 2 - 1) * amplitude for _ in range(count)])
+
+
+def _generatePython(numVertices, heightScale, roughness, seed):
+    rng = random.Random(seed)
+    heights = [[0.0] * numVertices for _ in range(numVertices)]
+    last = numVertices - 1
+
+    for i, j in ((0, 0), (0, last), (last, 0), (last, last)):
+        heights[i][j] = rng.random() * 2 - 1
+
+    amplitude = persistence(roughness)
+    step = last
+    while step > 1:
+        half = step // 2
+
+        # Diamond step
+        for i in range(half, numVertices, step):
+            for j in range(half, numVertices, step):
+                corners = heights[i - half][j - half] + heights[i - half][j + half] \
+                    + heights[i + half][j - half] + heights[i + half][j + half]
+                heights[i][j] = corners * 0.25 + (rng.random() * 2 - 1) * amplitude
+
+        # Square step, horizontal edges then vertical edges
+        for i in range(0, numVertices, step):
+            for j in range(half, numVertices, step):
+                total = heights[i][j - half] + heights[i][j + half]
+                count = 2
+                if i > 0:
+                    total += heights[i - half][j]
+                    count += 1
+                if i < last:
+                    total += heights[i + half][j]
+                    count += 1
+                heights[i][j] = total / count + (rng.random() * 2 - 1) * amplitude
+
+        for i in range(half, numVertices, step):
+            for j in range(0, numVertices, step):
+                total = heights[i - half][j] + heights[i + half][j]
+                count = 2
+                if j > 0:
+                    total += heights[i][j - half]
+                    count += 1
+                if j < last:
+                    total += heights[i][j + half]
+                    count += 1
+                heights[i][j] = total / count + (rng.random() * 2 - 1) * amplitude
+
+        amplitude *= persistence(roughness)
+        step = half
+
+    # Normalize to [0, 1] and apply the height scale
+    low = min(min(row) for row in heights)
+    span = max(max(row) for row in heights) - low
+    scale = heightScale / span if span > 0 else 0
+    return [[(value - low) * scale for value in row] for row in heights]
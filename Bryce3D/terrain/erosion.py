@@ -0,0 +1,166 @@
+"""Thermal and hydraulic erosion of height maps.
+
+Both passes update the whole grid at once with NumPy. Every iteration computes
+the new state only from the previous one and only looks at the four direct
+neighbours, so a change travels at most two cells per iteration. That lets a
+band of rows be eroded on its own, given haloRows() extra rows of context on
+each side, with exactly the same result as eroding the full map; tiled and
+parallel erosion rely on this. They run a few iterations at a time with
+erodeSteps, which hands back the water and sediment still in flight, so the
+context a band needs stays small however many iterations are asked for.
+
+The amounts below are relative to the height scale and the grid spacing, so
+eroding a map and then scaling it gives the same terrain as scaling first.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Thermal erosion: slopes steeper than TALUS_SLOPE (height scale per terrain
+# width) shed THERMAL_RATE of their excess to each lower neighbour per iteration
+TALUS_SLOPE = 0.5
+THERMAL_RATE = 0.5
+
+# Hydraulic erosion: rain per iteration, sediment carried per unit of flowing
+# water on a slope of one, and the fraction of the capacity difference eroded
+# or deposited
+RAIN = 0.01
+SEDIMENT_CAPACITY = 1.0
+SOLUBILITY = 0.3
+DEPOSITION = 0.3
+EVAPORATION = 0.05
+
+
+def haloRows(thermalIterations, hydraulicIterations):
+    # Rows of context a band needs on each side to be eroded independently
+    return 2 * (thermalIterations + hydraulicIterations)
+
+
+def erosionPasses(thermalIterations, hydraulicIterations, batchIterations):
+    # (thermal, hydraulic) iterations of each pass when erosion runs at most
+    # batchIterations at a time, thermal first
+    passes = []
+    while thermalIterations > 0 or hydraulicIterations > 0:
+        thermal = min(thermalIterations, batchIterations)
+        hydraulic = min(hydraulicIterations, batchIterations - thermal)
+        passes.append((thermal, hydraulic))
+        thermalIterations -= thermal
+        hydraulicIterations -= hydraulic
+    return passes
+
+
+def erode(heights, thermalIterations, hydraulicIterations, heightScale=1.0, numVertices=None):
+    # Apply thermal then hydraulic erosion and return a new float64 array.
+    # numVertices is the width of the full grid when heights is only a band of it.
+    heights, water, sediment = erodeSteps(heights, None, None, thermalIterations, hydraulicIterations,
+                                          heightScale, numVertices)
+    if sediment is not None:
+        # Whatever is still suspended settles where it is
+        heights += sediment
+    return heights
+
+
+def erodeSteps(heights, water, sediment, thermalIterations, hydraulicIterations, heightScale=1.0, numVertices=None):
+    # Run thermal then hydraulic iterations and return (heights, water, sediment)
+    # as float64 arrays, leaving the sediment suspended. water and sediment
+    # continue an earlier hydraulic run; both are None before the first one and
+    # stay None if there are no hydraulic iterations.
+    if np is None:
+        raise RuntimeError('Erosion needs NumPy.')
+    heights = np.array(heights, dtype=np.float64)
+    if numVertices is None:
+        numVertices = heights.shape[1]
+    cellSize = 1.0 / (numVertices - 1)
+
+    if thermalIterations > 0:
+        heights = thermalErosion(heights, thermalIterations, TALUS_SLOPE * cellSize * heightScale)
+    if hydraulicIterations > 0:
+        if water is None:
+            water = np.zeros_like(heights)
+            sediment = np.zeros_like(heights)
+        heights, water, sediment = hydraulicSteps(heights, water, sediment, hydraulicIterations,
+                                                  RAIN * heightScale, cellSize * heightScale)
+    return heights, water, sediment
+
+
+def thermalErosion(heights, iterations, talus, rate=THERMAL_RATE):
+    # Relax slopes whose height difference to a neighbour exceeds talus
+    heights = np.array(heights, dtype=np.float64)
+    for _ in range(iterations):
+        moved = [rate * 0.25 * np.maximum(heights - neighbour - talus, 0.0)
+                 for neighbour in _neighbours(heights)]
+        heights -= sum(moved)
+        heights += _inflow(moved)
+    return heights
+
+
+def hydraulicErosion(heights, iterations, rain, cellHeight):
+    # Grid based water simulation: rain falls on every cell, flows downhill,
+    # picks up sediment up to its capacity and drops it where it slows down.
+    # cellHeight is the height difference between neighbours on a slope of one.
+    heights = np.asarray(heights, dtype=np.float64)
+    heights, water, sediment = hydraulicSteps(heights, np.zeros_like(heights), np.zeros_like(heights),
+                                              iterations, rain, cellHeight)
+
+    # Whatever is still suspended settles where it is
+    heights += sediment
+    return heights
+
+
+def hydraulicSteps(heights, water, sediment, iterations, rain, cellHeight):
+    # Iterations of hydraulicErosion starting from the given water and sediment;
+    # returns new (heights, water, sediment) arrays without settling the sediment
+    heights = np.array(heights, dtype=np.float64)
+    water = np.array(water, dtype=np.float64)
+    sediment = np.array(sediment, dtype=np.float64)
+
+    for _ in range(iterations):
+        water += rain
+
+        # Outflow to each lower neighbour, in proportion to the drop of the water surface
+        surface = heights + water
+        drops = [np.maximum(surface - neighbour, 0.0) for neighbour in _neighbours(surface)]
+        totalDrop = sum(drops)
+        outflow = np.minimum(water, totalDrop * 0.5)
+        hasDrop = totalDrop > 0
+        fractions = [np.divide(drop, totalDrop, out=np.zeros_like(drop), where=hasDrop) for drop in drops]
+
+        # Erode where the water can carry more than it does, deposit otherwise.
+        # Faster water on steeper ground carries more, but a cell is never dug
+        # deeper than half the drop to its lowest neighbour.
+        steepestDrop = np.maximum(np.maximum.reduce([heights - neighbour for neighbour in _neighbours(heights)]), 0.0)
+        capacity = SEDIMENT_CAPACITY * outflow * steepestDrop / cellHeight
+        erodeAmount = np.minimum(SOLUBILITY * (capacity - sediment), 0.5 * steepestDrop)
+        deposit = np.where(sediment > capacity, DEPOSITION * (sediment - capacity), -erodeAmount)
+        heights += deposit
+        sediment -= deposit
+
+        # Move water and the sediment it carries
+        movedShare = np.divide(outflow, water, out=np.zeros_like(water), where=water > 0)
+        movedSediment = sediment * movedShare
+        water += _inflow([outflow * fraction for fraction in fractions]) - outflow
+        sediment += _inflow([movedSediment * fraction for fraction in fractions]) - movedSediment
+
+        water *= 1.0 - EVAPORATION
+
+    return heights, water, sediment
+
+
+def _neighbours(values):
+    # Up, down, left and right neighbour of every cell. Cells on the edge use
+    # themselves, so nothing flows off the map.
+    padded = np.pad(values, 1, mode='edge')
+    return [padded[:-2, 1:-1], padded[2:, 1:-1], padded[1:-1, :-2], padded[1:-1, 2:]]
+
+
+def _inflow(outflows):
+    # Amount arriving in every cell given what each cell sends up, down, left and right
+    up, down, left, right = outflows
+    inflow = np.zeros_like(up)
+    inflow[:-1, :] += up[1:, :]
+    inflow[1:, :] += down[:-1, :]
+    inflow[:, :-1] += left[:, 1:]
+    inflow[:, 1:] += right[:, :-1]
+    return inflow
@@ -0,0 +1,290 @@
+"""Binary STL and OBJ export for terrains.
+
+Height maps are written by streaming triangles one pair of grid rows at a time,
+so any object that can hand out rows (a NumPy array, a np.memmap of a large
+terrain or a list of row lists) can be exported without building per-triangle
+Python objects. Nothing here depends on Fusion, e.g. from a plain Python
+process started in the Bryce3D folder:
+
+    from terrain import heightmap, exporter
+    heights = heightmap.generateHeightMap(1025, 10.0, 8, 42)
+    exporter.exportHeightMap('terrain.stl', heights, 100.0, baseHeight=-0.1)
+
+Coordinates are written in the same units as size and the heights, z up.
+"""
+
+import os
+import struct
+
+from .mesh import gridBorder
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+STL_HEADER = b'Bryce3D terrain'
+
+# Layout of one binary STL triangle record (50 bytes)
+_STL_RECORD = struct.Struct('<12fH')
+if np is not None:
+    _STL_DTYPE = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+
+
+def exportHeightMap(path, heightMap, size, baseHeight=None, scale=1.0):
+    # Write a height map as .stl or .obj depending on the file extension.
+    # With a baseHeight the terrain is closed with skirt walls and a base.
+    # All coordinates are multiplied by scale, e.g. 10 to write Fusion's cm as mm.
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.stl':
+        return writeHeightMapSTL(path, heightMap, size, baseHeight, scale)
+    if extension == '.obj':
+        return writeHeightMapOBJ(path, heightMap, size, baseHeight, scale)
+    raise ValueError('Unsupported export format: {}'.format(extension))
+
+
+def exportMesh(path, terrainMesh, scale=1.0):
+    # Write a mesh.TriangleMesh as .stl or .obj depending on the file extension
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.stl':
+        return writeMeshSTL(path, terrainMesh, scale)
+    if extension == '.obj':
+        return writeMeshOBJ(path, terrainMesh, scale)
+    raise ValueError('Unsupported export format: {}'.format(extension))
+
+
+def heightMapTriangleCount(numVertices, closed):
+    # Number of triangles written for a height map
+    count = 2 * (numVertices - 1) ** 2
+    if closed:
+        # Two triangles per skirt quad and one base fan triangle per border edge
+        count += 3 * 4 * (numVertices - 1)
+    return count
+
+
+def writeHeightMapSTL(path, heightMap, size, baseHeight=None, scale=1.0):
+    # Stream a height map into a binary STL file. Returns the triangle count.
+    numVertices = len(heightMap)
+    spacing = size * scale / (numVertices - 1)
+    count = heightMapTriangleCount(numVertices, baseHeight is not None)
+
+    with open(path, 'wb') as stlFile:
+        stlFile.write(STL_HEADER.ljust(80, b'\0'))
+        stlFile.write(struct.pack('<I', count))
+
+        if np is not None:
+            xs = np.arange(numVertices, dtype=np.float64) * spacing
+            for i in range(numVertices - 1):
+                triangles = _rowPairTriangles(heightMap[i], heightMap[i + 1], i * spacing, (i + 1) * spacing, xs, scale)
+                _writeSTLRecords(stlFile, triangles)
+            if baseHeight is not None:
+                _writeSTLRecords(stlFile, _closureTriangles(_borderPoints(heightMap, spacing, scale), baseHeight * scale))
+        else:
+            for i in range(numVertices - 1):
+                stlFile.write(b''.join(_packSTLTriangle(triangle)
+                                       for triangle in _rowPairTrianglesPython(heightMap[i], heightMap[i + 1], i, spacing, scale)))
+            if baseHeight is not None:
+                border = _borderPointsPython(heightMap, spacing, scale)
+                stlFile.write(b''.join(_packSTLTriangle(triangle)
+                                       for triangle in _closureTrianglesPython(border, baseHeight * scale)))
+    return count
+
+
+def writeHeightMapOBJ(path, heightMap, size, baseHeight=None, scale=1.0):
+    # Stream a height map into a Wavefront OBJ file. Returns the triangle count.
+    numVertices = len(heightMap)
+    spacing = size * scale / (numVertices - 1)
+    closed = baseHeight is not None
+
+    with open(path, 'w') as objFile:
+        objFile.write('# {}\n'.format(STL_HEADER.decode()))
+        objFile.write('o terrain\n')
+
+        # Vertex rows, then the base ring and base centre for a closed terrain
+        for i in range(numVertices):
+            row = heightMap[i]
+            objFile.write(''.join('v {:.6f} {:.6f} {:.6f}\n'.format(j * spacing, i * spacing, float(row[j]) * scale)
+                                  for j in range(numVertices)))
+        if closed:
+            border = gridBorder(numVertices)
+            objFile.write(''.join('v {:.6f} {:.6f} {:.6f}\n'.format((index % numVertices) * spacing,
+                                                                     (index // numVertices) * spacing, baseHeight * scale)
+                                  for index in border))
+            center = size * scale / 2
+            objFile.write('v {:.6f} {:.6f} {:.6f}\n'.format(center, center, baseHeight * scale))
+
+        # Faces use 1-based vertex indices
+        for i in range(numVertices - 1):
+            faces = []
+            for j in range(numVertices - 1):
+                corner = i * numVertices + j + 1
+                faces.append('f {} {} {}\n'.format(corner, corner + 1, corner + numVertices + 1))
+                faces.append('f {} {} {}\n'.format(corner, corner + numVertices + 1, corner + numVertices))
+            objFile.write(''.join(faces))
+        if closed:
+            _writeOBJClosure(objFile, border, numVertices * numVertices + 1)
+
+    return heightMapTriangleCount(numVertices, closed)
+
+
+def writeMeshSTL(path, terrainMesh, scale=1.0, chunkSize=65536):
+    # Write a TriangleMesh as binary STL, converting chunkSize triangles at a time
+    count = terrainMesh.triangleCount
+    with open(path, 'wb') as stlFile:
+        stlFile.write(STL_HEADER.ljust(80, b'\0'))
+        stlFile.write(struct.pack('<I', count))
+        if np is not None:
+            vertices = np.asarray(terrainMesh.vertices, dtype=np.float64) * scale
+            triangles = np.asarray(terrainMesh.triangles, dtype=np.int64)
+            for start in range(0, count, chunkSize):
+                _writeSTLRecords(stlFile, vertices[triangles[start:start + chunkSize]])
+        else:
+            vertices = [(x * scale, y * scale, z * scale) for x, y, z in terrainMesh.vertices]
+            for start in range(0, count, chunkSize):
+                stlFile.write(b''.join(_packSTLTriangle([vertices[index] for index in triangle])
+                                       for triangle in terrainMesh.triangles[start:start + chunkSize]))
+    return count
+
+
+def writeMeshOBJ(path, terrainMesh, scale=1.0, chunkSize=65536):
+    # Write a TriangleMesh as Wavefront OBJ
+    with open(path, 'w') as objFile:
+        objFile.write('# {}\n'.format(STL_HEADER.decode()))
+        objFile.write('o terrain\n')
+        vertices = terrainMesh.vertices
+        for start in range(0, len(vertices), chunkSize):
+            objFile.write(''.join('v {:.6f} {:.6f} {:.6f}\n'.format(float(x) * scale, float(y) * scale, float(z) * scale)
+                                  for x, y, z in vertices[start:start + chunkSize]))
+        triangles = terrainMesh.triangles
+        for start in range(0, len(triangles), chunkSize):
+            objFile.write(''.join('f {} {} {}\n'.format(int(a) + 1, int(b) + 1, int(c) + 1)
+                                  for a, b, c in triangles[start:start + chunkSize]))
+    return terrainMesh.triangleCount
+
+
+def _writeSTLRecords(stlFile, triangles):
+    # triangles: (m, 3, 3) array of corner coordinates
+    records = np.zeros(len(triangles), dtype=_STL_DTYPE)
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    lengths[lengths == 0] = 1
+    records['normal'] = normals / lengths[:, np.newaxis]
+    records['vertices'] = triangles
+    records.tofile(stlFile)
+
+
+def _rowPairTriangles(row0, row1, y0, y1, xs, scale):
+    # The two triangles of every cell between two grid rows, as (m, 3, 3) corners
+    row0 = np.asarray(row0, dtype=np.float64) * scale
+    row1 = np.asarray(row1, dtype=np.float64) * scale
+    cells = len(xs) - 1
+
+    p00 = np.column_stack([xs[:-1], np.full(cells, y0), row0[:-1]])
+    p01 = np.column_stack([xs[1:], np.full(cells, y0), row0[1:]])
+    p10 = np.column_stack([xs[:-1], np.full(cells, y1), row1[:-1]])
+    p11 = np.column_stack([xs[1:], np.full(cells, y1), row1[1:]])
+
+    triangles = np.empty((2 * cells, 3, 3), dtype=np.float64)
+    triangles[0::2, 0] = p00
+    triangles[0::2, 1] = p01
+    triangles[0::2, 2] = p11
+    triangles[1::2, 0] = p00
+    triangles[1::2, 1] = p11
+    triangles[1::2, 2] = p10
+    return triangles
+
+
+def _borderPoints(heightMap, spacing, scale):
+    # Points around the edge of the terrain, counter-clockwise seen from above
+    numVertices = len(heightMap)
+    last = numVertices - 1
+    coords = np.arange(numVertices, dtype=np.float64) * spacing
+    firstRow = np.asarray(heightMap[0], dtype=np.float64) * scale
+    lastRow = np.asarray(heightMap[last], dtype=np.float64) * scale
+    firstColumn = np.array([heightMap[i][0] for i in range(numVertices)], dtype=np.float64) * scale
+    lastColumn = np.array([heightMap[i][last] for i in range(numVertices)], dtype=np.float64) * scale
+
+    sides = [
+        np.column_stack([coords[:-1], np.zeros(last), firstRow[:-1]]),
+        np.column_stack([np.full(last, coords[last]), coords[:-1], lastColumn[:-1]]),
+        np.column_stack([coords[:0:-1], np.full(last, coords[last]), lastRow[:0:-1]]),
+        np.column_stack([np.zeros(last), coords[:0:-1], firstColumn[:0:-1]]),
+    ]
+    return np.vstack(sides)
+
+
+def _closureTriangles(border, baseHeight):
+    # Skirt walls and base fan for a closed border ring, as (m, 3, 3) corners
+    nextBorder = np.roll(border, -1, axis=0)
+    base = border.copy()
+    base[:, 2] = baseHeight
+    nextBase = np.roll(base, -1, axis=0)
+    center = np.broadcast_to(base.mean(axis=0), base.shape)
+    return np.concatenate([
+        np.stack([border, nextBase, nextBorder], axis=1),
+        np.stack([border, base, nextBase], axis=1),
+        np.stack([center, nextBase, base], axis=1),
+    ])
+
+
+def _packSTLTriangle(corners):
+    a, b, c = corners
+    ux, uy, uz = b[0] - a[0], b[1] - a[1], b[2] - a[2]
+    vx, vy, vz = c[0] - a[0], c[1] - a[1], c[2] - a[2]
+    nx, ny, nz = uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx
+    length = (nx * nx + ny * ny + nz * nz) ** 0.5 or 1
+    return _STL_RECORD.pack(nx / length, ny / length, nz / length,
+                            a[0], a[1], a[2], b[0], b[1], b[2], c[0], c[1], c[2], 0)
+
+
+def _rowPairTrianglesPython(row0, row1, i, spacing, scale):
+    y0 = i * spacing
+    y1 = (i + 1) * spacing
+    for j in range(len(row0) - 1):
+        x0 = j * spacing
+        x1 = (j + 1) * spacing
+        p00 = (x0, y0, row0[j] * scale)
+        p01 = (x1, y0, row0[j + 1] * scale)
+        p10 = (x0, y1, row1[j] * scale)
+        p11 = (x1, y1, row1[j + 1] * scale)
+        yield (p00, p01, p11)
+        yield (p00, p11, p10)
+
+
+def _borderPointsPython(heightMap, spacing, scale):
+    numVertices = len(heightMap)
+    return [((index % numVertices) * spacing, (index // numVertices) * spacing,
+             heightMap[index // numVertices][index % numVertices] * scale)
+            for index in gridBorder(numVertices)]
+
+
+def _closureTrianglesPython(border, baseHeight):
+    count = len(border)
+    centerX = sum(point[0] for point in border) / count
+    centerY = sum(point[1] for point in border) / count
+    center = (centerX, centerY, baseHeight)
+    for k in range(count):
+        top = border[k]
+        nextTop = border[(k + 1) % count]
+        base = (top[0], top[1], baseHeight)
+        nextBase = (nextTop[0], nextTop[1], baseHeight)
+        yield (top, nextBase, nextTop)
+        yield (top, base, nextBase)
+        yield (center, nextBase, base)
+
+
+def _writeOBJClosure(objFile, border, firstBase):
+    # firstBase is the 1-based index of the first base ring vertex
+    count = len(border)
+    center = firstBase + count
+    faces = []
+    for k in range(count):
+        top = border[k] + 1
+        nextTop = border[(k + 1) % count] + 1
+        base = firstBase + k
+        nextBase = firstBase + (k + 1) % count
+        faces.append('f {} {} {}\n'.format(top, nextBase, nextTop))
+        faces.append('f {} {} {}\n'.format(top, base, nextBase))
+        faces.append('f {} {} {}\n'.format(center, nextBase, base))
+    objFile.write(''.join(faces))
+
@@ -0,0 +1,112 @@
+"""Height map generation for the Bryce 3D terrain generator.
+
+All octaves of the terrain noise are evaluated for the whole grid at once with
+NumPy. Fusion's bundled interpreter does not always have NumPy installed (see
+PackageManager), so the same noise is also available as a pure Python fallback.
+"""
+
+from . import noise as gradientNoise
+from . import diamondSquare
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Bump when a change to a generator alters the heights it produces for the
+# same parameters, so that cached height maps are regenerated
+GENERATOR_VERSION = 1
+
+# Available height map generators
+PERLIN = 'perlin'
+DIAMOND_SQUARE = 'diamondSquare'
+
+
+def hasNumpy():
+    # True when the vectorized engine is available
+    return np is not None
+
+
+def gridSize(detailLevel):
+    # Number of vertices along one side of the terrain grid
+    return 2 ** detailLevel + 1
+
+
+def generateHeightMap(numVertices, heightScale, roughness, seed, generator=PERLIN):
+    # Build a numVertices x numVertices height map with values in [0, heightScale].
+    # The noise is sampled in unit grid coordinates, so the result does not depend
+    # on the terrain size. Returns a 2D NumPy array when NumPy is available and a
+    # list of row lists otherwise; both can be indexed as heightMap[i][j].
+    if generator == DIAMOND_SQUARE:
+        return diamondSquare.generateHeightMap(numVertices, heightScale, roughness, seed)
+    if generator != PERLIN:
+        raise ValueError('Unknown terrain generator: {}'.format(generator))
+
+    if np is not None:
+        return _generateHeightMapNumpy(numVertices, heightScale, roughness, seed)
+    return _generateHeightMapPython(numVertices, heightScale, roughness, seed)
+
+
+def generateRows(numVertices, heightScale, roughness, seed, rowStart, rowStop):
+    # Rows rowStart to rowStop - 1 of the Perlin height map as a NumPy array.
+    # Every point is computed independently, so a map assembled from row bands
+    # is identical to one generated in a single call.
+    columns = np.arange(numVertices, dtype=np.float64) / (numVertices - 1)
+    rows = np.arange(rowStart, rowStop, dtype=np.float64) / (numVertices - 1)
+
+    noise = np.zeros((rowStop - rowStart, numVertices), dtype=np.float64)
+    frequency = 1.0
+    amplitude = 1.0
+    maxValue = 0.0
+
+    for octave in range(roughness):
+        offsetX, offsetY = gradientNoise.octaveOffset(seed, octave)
+        x = (columns * frequency + offsetX)[np.newaxis, :]
+        y = (rows * frequency + offsetY)[:, np.newaxis]
+        noise += amplitude * gradientNoise.perlinArray(x, y, seed)
+        maxValue += amplitude
+        frequency *= 2
+        amplitude *= 0.5
+
+    # Normalize the noise to be in range [0, 1] and apply the height scale
+    noise /= maxValue
+    noise += 1
+    noise *= 0.5 * heightScale
+    return noise
+
+
+def _generateHeightMapNumpy(numVertices, heightScale, roughness, seed):
+    return generateRows(numVertices, heightScale, roughness, seed, 0, numVertices)
+
+
+def _generateHeightMapPython(numVertices, heightScale, roughness, seed):
+    heightMap = []
+    for i in range(numVertices):
+        y = i / (numVertices - 1)
+        row = []
+        for j in range(numVertices):
+            x = j / (numVertices - 1)
+            row.append(_generateHeight(x, y, heightScale, roughness, seed))
+        heightMap.append(row)
+    return heightMap
+
+
+def _generateHeight(x, y, heightScale, roughness, seed):
+    # Multiple octaves of noise for a single point in unit grid coordinates
+    noise = 0
+    frequency = 1.0
+    amplitude = 1.0
+    maxValue = 0
+
+    for octave in range(roughness):
+        offsetX, offsetY = gradientNoise.octaveOffset(seed, octave)
+        noise += amplitude * gradientNoise.perlin2D(x * frequency + offsetX, y * frequency + offsetY, seed)
+        maxValue += amplitude
+        frequency *= 2
+        amplitude *= 0.5
+
+    # Normalize the noise to be in range [0, 1]
+    noise = (noise / maxValue + 1) * 0.5
+
+    # Apply height scale
+    return noise * heightScale
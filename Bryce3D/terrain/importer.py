@@ -0,0 +1,317 @@
+"""Height maps imported from elevation rasters.
+
+Supported files:
+    .raw, .r16      headerless little-endian uint16 grid
+    .r32, .f32      headerless little-endian float32 grid
+    .pgm            binary (P5) PGM, 8 or 16 bit
+    .png            8 or 16 bit grayscale PNG, optionally with alpha
+
+Raw and PGM files are memory-mapped and only the source rows that the target
+grid actually samples are read, a block at a time. PNG data is compressed, so
+it is decoded as a stream of scanlines and every row is dropped as soon as it
+has been sampled. Either way the file is never held in memory as a whole.
+
+Headerless files must be square unless their width and height are given.
+Resampling is bilinear and fully vectorized; the result is rescaled so that
+its lowest point is 0 and its highest is heightScale, like the generators.
+"""
+
+import os
+import struct
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# File extensions of headerless rasters and their sample types
+RAW_TYPES = {
+    '.raw': '<u2',
+    '.r16': '<u2',
+    '.r32': '<f4',
+    '.f32': '<f4',
+}
+
+SUPPORTED_EXTENSIONS = sorted(list(RAW_TYPES) + ['.pgm', '.png'])
+
+# Target rows resampled per block when reading memory-mapped rasters
+_ROW_BLOCK = 64
+
+# Compressed bytes read, and inflated bytes produced, per step of the PNG reader
+PNG_BLOCK_BYTES = 1 << 20
+
+# Scanline bytes unfiltered together by the PNG reader. Average and Paeth
+# rows are decoded one diagonal of pixels at a time across the whole block,
+# so larger blocks mean fewer NumPy steps per row.
+PNG_UNFILTER_BYTES = 1 << 22
+
+
+def importHeightMap(path, numVertices, heightScale, width=None, height=None):
+    # Resample an elevation raster to a numVertices x numVertices height map
+    if np is None:
+        raise RuntimeError('Importing height maps needs NumPy.')
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.png':
+        raster = PNGRaster(path)
+        heights = _resampleStream(raster, numVertices)
+    else:
+        if extension == '.pgm':
+            raster = openPGM(path)
+        elif extension in RAW_TYPES:
+            raster = openRaw(path, RAW_TYPES[extension], width, height)
+        else:
+            raise ValueError('Unsupported height map file: {}'.format(path))
+        heights = _resampleArray(raster, numVertices)
+        del raster
+
+    low = heights.min()
+    span = heights.max() - low
+    heights -= low
+    if span > 0:
+        heights *= heightScale / span
+    return heights
+
+
+def openRaw(path, dtype, width=None, height=None):
+    # Memory-map a headerless raster
+    itemSize = np.dtype(dtype).itemsize
+    count = os.path.getsize(path) // itemSize
+    if width is None and height is None:
+        width = int(round(count ** 0.5))
+        height = width
+    elif width is None:
+        width = count // height
+    elif height is None:
+        height = count // width
+    if width * height != count:
+        raise ValueError('{} holds {} samples, which is not a {} x {} grid.'.format(path, count, width, height))
+    return np.memmap(path, dtype=dtype, mode='r', shape=(height, width))
+
+
+def openPGM(path):
+    # Memory-map the samples of a binary PGM file
+    with open(path, 'rb') as pgmFile:
+        header = pgmFile.read(1024)
+
+    fields = []
+    position = 0
+    while len(fields) < 4:
+        # Skip whitespace and comments between header fields
+        while position < len(header) and header[position:position + 1].isspace():
+            position += 1
+        if header[position:position + 1] == b'#':
+            position = header.index(b'\n', position) + 1
+            continue
+        start = position
+        while position < len(header) and not header[position:position + 1].isspace():
+            position += 1
+        fields.append(header[start:position])
+    if fields[0] != b'P5':
+        raise ValueError('{} is not a binary (P5) PGM file.'.format(path))
+
+    width, height, maxValue = (int(field) for field in fields[1:])
+    # A single whitespace character separates the header from the samples
+    offset = position + 1
+    dtype = '>u2' if maxValue > 255 else 'u1'
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(height, width))
+
+
+class PNGRaster:
+    # Streaming reader for grayscale PNG files
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as pngFile:
+            if pngFile.read(8) != b'\x89PNG\r\n\x1a\n':
+                raise ValueError('{} is not a PNG file.'.format(path))
+            length, chunkType = struct.unpack('>I4s', pngFile.read(8))
+            if chunkType != b'IHDR':
+                raise ValueError('{} has no PNG header.'.format(path))
+            (self.width, self.height, self.bitDepth, colorType,
+             _, _, interlace) = struct.unpack('>IIBBBBB', pngFile.read(length))
+
+        if colorType not in (0, 4) or self.bitDepth not in (8, 16) or interlace != 0:
+            raise ValueError('Only non-interlaced 8 or 16 bit grayscale PNG files are supported.')
+        self.channels = 1 if colorType == 0 else 2
+        self.bytesPerPixel = self.channels * self.bitDepth // 8
+        self.shape = (self.height, self.width)
+
+    def rows(self):
+        # Yield every row of samples, top to bottom, as a NumPy array. The image
+        # data is read and inflated in blocks of at most PNG_BLOCK_BYTES and
+        # unfiltered in blocks of about PNG_UNFILTER_BYTES, so memory stays
+        # bounded however large the IDAT chunks are.
+        stride = self.width * self.bytesPerPixel
+        sampleType = '>u2' if self.bitDepth == 16 else 'u1'
+        # No more rows than columns, which bounds the skewed wavefront array
+        blockRows = max(1, min(PNG_UNFILTER_BYTES // stride, self.width))
+        decompressor = zlib.decompressobj()
+        pending = bytearray()
+        previous = np.zeros(stride, dtype=np.uint8)
+        rowIndex = 0
+
+        for data in self._imageData():
+            while data and rowIndex < self.height:
+                pending += decompressor.decompress(data, PNG_BLOCK_BYTES)
+                data = decompressor.unconsumed_tail
+
+                # Unfilter full blocks of scanlines, or the rest of the image
+                count = min(len(pending) // (stride + 1), self.height - rowIndex)
+                while count >= blockRows or (count and count == self.height - rowIndex):
+                    blockCount = min(count, blockRows)
+                    size = blockCount * (stride + 1)
+                    lines = np.frombuffer(bytes(pending[:size]), dtype=np.uint8).reshape(blockCount, stride + 1)
+                    del pending[:size]
+                    decoded = _unfilterRows(lines[:, 0], lines[:, 1:], previous, self.bytesPerPixel)
+                    previous = decoded[-1]
+                    for row in decoded:
+                        # Keep only the gray channel
+                        samples = row.view(sampleType).reshape(self.width, self.channels)[:, 0]
+                        yield samples.astype(np.float64)
+                    rowIndex += blockCount
+                    count -= blockCount
+            if rowIndex >= self.height:
+                return
+
+    def _imageData(self):
+        # Yield the payload of the IDAT chunks in pieces of at most
+        # PNG_BLOCK_BYTES without reading the whole file
+        with open(self.path, 'rb') as pngFile:
+            pngFile.seek(8)
+            while True:
+                header = pngFile.read(8)
+                if len(header) < 8:
+                    return
+                length, chunkType = struct.unpack('>I4s', header)
+                if chunkType == b'IDAT':
+                    while length > 0:
+                        data = pngFile.read(min(length, PNG_BLOCK_BYTES))
+                        if not data:
+                            return
+                        length -= len(data)
+                        yield data
+                    pngFile.seek(4, os.SEEK_CUR)
+                elif chunkType == b'IEND':
+                    return
+                else:
+                    pngFile.seek(length + 4, os.SEEK_CUR)
+
+
+def _unfilterRows(filterTypes, lines, previous, bytesPerPixel):
+    # Undo the PNG filters of a block of scanlines below the row previous.
+    # None, Sub and Up rows are vectorized along the row; runs of Average and
+    # Paeth rows, which depend on the byte just decoded, go to the wavefront.
+    decoded = np.empty_like(lines)
+    start = 0
+    while start < len(lines):
+        stop = start + 1
+        if filterTypes[start] in (3, 4):
+            while stop < len(lines) and filterTypes[stop] in (3, 4):
+                stop += 1
+            decoded[start:stop] = _unfilterWavefront(filterTypes[start:stop], lines[start:stop], previous, bytesPerPixel)
+        else:
+            decoded[start] = _unfilter(filterTypes[start], lines[start], previous, bytesPerPixel)
+        previous = decoded[stop - 1]
+        start = stop
+    return decoded
+
+
+def _unfilter(filterType, line, previous, bytesPerPixel):
+    # Undo the None, Sub or Up filter of one scanline
+    if filterType == 0:
+        return line
+    if filterType == 1:
+        return np.cumsum(line.reshape(-1, bytesPerPixel), axis=0, dtype=np.uint8).reshape(-1)
+    if filterType == 2:
+        return line + previous
+    raise ValueError('Unknown PNG filter type {}.'.format(filterType))
+
+
+def _unfilterWavefront(filterTypes, lines, previous, bytesPerPixel):
+    # Undo Average (3) and Paeth (4) filters. A pixel depends on the pixels to
+    # its left, above and above left, so all pixels on one anti-diagonal of the
+    # block are independent. The block is stored skewed, pixel (r, c) at
+    # skewed[c + r + 2, r + 1] with previous as r = -1, which makes every
+    # diagonal one contiguous row of skewed and its neighbours the two rows
+    # before it. The zeros left of each row stand in for missing neighbours.
+    count = len(lines)
+    width = lines.shape[1] // bytesPerPixel
+    skewed = np.zeros((width + count + 1, count + 1, bytesPerPixel), dtype=np.uint8)
+    rowStride, columnStride, byteStride = skewed.strides
+    pixels = np.lib.stride_tricks.as_strided(skewed[2:, 1:], shape=(count, width, bytesPerPixel),
+                                             strides=(rowStride + columnStride, rowStride, byteStride))
+    pixels[...] = lines.reshape(count, width, bytesPerPixel)
+    skewed[1:width + 1, 0] = previous.reshape(width, bytesPerPixel)
+
+    paeth = (filterTypes == 4)[:, np.newaxis]
+    anyAverage = not paeth.all()
+    anyPaeth = paeth.any()
+    for diagonal in range(count + width - 1):
+        first = max(0, diagonal - width + 1)
+        last = min(count, diagonal + 1)
+        left = skewed[diagonal + 1, first + 1:last + 1].astype(np.int16)
+        up = skewed[diagonal + 1, first:last].astype(np.int16)
+        if anyPaeth:
+            upLeft = skewed[diagonal, first:last].astype(np.int16)
+            distanceLeft = np.abs(up - upLeft)
+            distanceUp = np.abs(left - upLeft)
+            distanceUpLeft = np.abs(left + up - 2 * upLeft)
+            predictor = np.where((distanceLeft <= distanceUp) & (distanceLeft <= distanceUpLeft), left,
+                                 np.where(distanceUp <= distanceUpLeft, up, upLeft))
+            if anyAverage:
+                predictor = np.where(paeth[first:last], predictor, (left + up) >> 1)
+        else:
+            predictor = (left + up) >> 1
+        skewed[diagonal + 2, first + 1:last + 1] += predictor.astype(np.uint8)
+
+    return pixels.reshape(count, -1)
+
+
+def _samplePositions(sourceSize, numVertices):
+    # Lower source index, upper source index and blend weight for every target sample
+    positions = np.arange(numVertices, dtype=np.float64) * ((sourceSize - 1) / (numVertices - 1))
+    lower = np.minimum(np.floor(positions).astype(np.intp), sourceSize - 1)
+    upper = np.minimum(lower + 1, sourceSize - 1)
+    return lower, upper, positions - lower
+
+
+def _resampleArray(raster, numVertices):
+    # Bilinear resampling of a 2D array-like, reading only the rows that are used
+    sourceHeight, sourceWidth = raster.shape
+    rowLower, rowUpper, rowWeight = _samplePositions(sourceHeight, numVertices)
+    columnLower, columnUpper, columnWeight = _samplePositions(sourceWidth, numVertices)
+
+    heights = np.empty((numVertices, numVertices), dtype=np.float64)
+    for start in range(0, numVertices, _ROW_BLOCK):
+        stop = min(start + _ROW_BLOCK, numVertices)
+        lowerRows = np.asarray(raster[rowLower[start:stop]], dtype=np.float64)
+        upperRows = np.asarray(raster[rowUpper[start:stop]], dtype=np.float64)
+        weight = rowWeight[start:stop, np.newaxis]
+        rows = lowerRows + weight * (upperRows - lowerRows)
+        heights[start:stop] = rows[:, columnLower] + columnWeight * (rows[:, columnUpper] - rows[:, columnLower])
+    return heights
+
+
+def _resampleStream(raster, numVertices):
+    # Bilinear resampling of a raster that can only be read top to bottom
+    sourceHeight, sourceWidth = raster.shape
+    rowLower, rowUpper, rowWeight = _samplePositions(sourceHeight, numVertices)
+    columnLower, columnUpper, columnWeight = _samplePositions(sourceWidth, numVertices)
+    needed = set(rowLower.tolist()) | set(rowUpper.tolist())
+
+    # Each needed source row is reduced to numVertices samples straight away
+    sampledRows = {}
+    for index, row in enumerate(raster.rows()):
+        if index in needed:
+            sampledRows[index] = row[columnLower] + columnWeight * (row[columnUpper] - row[columnLower])
+        if index >= rowUpper[-1]:
+            break
+
+    heights = np.empty((numVertices, numVertices), dtype=np.float64)
+    for i in range(numVertices):
+        lower = sampledRows[rowLower[i]]
+        upper = sampledRows[rowUpper[i]]
+        heights[i] = lower + rowWeight[i] * (upper - lower)
+    return heights
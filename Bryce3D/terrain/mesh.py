@@ -0,0 +1,194 @@
+"""Indexed triangle meshes built from height maps.
+
+A TriangleMesh holds one shared vertex buffer and a triangle index list. The
+terrain surface is built straight from the height map grid and can be closed
+into a watertight solid with skirt walls down to a flat base. Vertices are
+(x, y, z) with z up; triangles are counter-clockwise seen from outside.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class TriangleMesh:
+    def __init__(self, vertices, triangles, border):
+        # vertices: (n, 3) array or list of (x, y, z) tuples
+        # triangles: (m, 3) array or list of vertex index triples
+        # border: vertex indices around the edge of the surface, counter-clockwise
+        #         seen from above; empty once the mesh has been closed
+        self.vertices = vertices
+        self.triangles = triangles
+        self.border = border
+
+    @property
+    def vertexCount(self):
+        return len(self.vertices)
+
+    @property
+    def triangleCount(self):
+        return len(self.triangles)
+
+    def flatCoordinates(self):
+        # x, y, z of every vertex in one flat list, as the Fusion API expects
+        if np is not None and isinstance(self.vertices, np.ndarray):
+            return self.vertices.ravel().tolist()
+        return [value for vertex in self.vertices for value in vertex]
+
+    def flatVertexNormals(self):
+        # Unit normal of every vertex, averaged from the faces around it and
+        # weighted by their area, as one flat list of x, y, z
+        if np is not None:
+            vertices = np.asarray(self.vertices, dtype=np.float64)
+            triangles = np.asarray(self.triangles, dtype=np.int64)
+            corners = vertices[triangles]
+            faceNormals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+            normals = np.zeros_like(vertices)
+            for corner in range(3):
+                np.add.at(normals, triangles[:, corner], faceNormals)
+            lengths = np.linalg.norm(normals, axis=1)
+            lengths[lengths == 0] = 1
+            return (normals / lengths[:, np.newaxis]).ravel().tolist()
+
+        normals = [[0.0, 0.0, 0.0] for _ in self.vertices]
+        for a, b, c in self.triangles:
+            ax, ay, az = self.vertices[a]
+            bx, by, bz = self.vertices[b]
+            cx, cy, cz = self.vertices[c]
+            ux, uy, uz = bx - ax, by - ay, bz - az
+            vx, vy, vz = cx - ax, cy - ay, cz - az
+            face = (uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx)
+            for index in (a, b, c):
+                normal = normals[index]
+                normal[0] += face[0]
+                normal[1] += face[1]
+                normal[2] += face[2]
+        flat = []
+        for x, y, z in normals:
+            length = (x * x + y * y + z * z) ** 0.5 or 1
+            flat.extend((x / length, y / length, z / length))
+        return flat
+
+    def flatIndices(self):
+        # Vertex indices of every triangle in one flat list
+        if np is not None and isinstance(self.triangles, np.ndarray):
+            return self.triangles.ravel().tolist()
+        return [index for triangle in self.triangles for index in triangle]
+
+
+def gridBorder(numVertices, numRows=None):
+    # Grid indices (row * numVertices + column) around the edge of a grid with
+    # numVertices columns, counter-clockwise seen from above, starting at the
+    # origin corner. The grid is square unless numRows is given.
+    if numRows is None:
+        numRows = numVertices
+    last = numVertices - 1
+    lastRow = numRows - 1
+    border = [j for j in range(last)]
+    border += [i * numVertices + last for i in range(lastRow)]
+    border += [lastRow * numVertices + j for j in range(last, 0, -1)]
+    border += [i * numVertices for i in range(lastRow, 0, -1)]
+    return border
+
+
+def gridMesh(heightMap, size, firstRow=0):
+    # Surface mesh with one vertex per height map sample and two triangles per cell.
+    # heightMap may also be a band of rows of a larger square grid that starts at
+    # firstRow, e.g. one tile of a tiles.TiledHeightMap.
+    numRows = len(heightMap)
+    numVertices = len(heightMap[0])
+    spacing = size / (numVertices - 1)
+
+    if np is not None:
+        heights = np.asarray(heightMap, dtype=np.float64)
+        coords = np.arange(numVertices, dtype=np.float64) * spacing
+        rowCoords = np.arange(firstRow, firstRow + numRows, dtype=np.float64) * spacing
+        vertices = np.empty((numRows, numVertices, 3), dtype=np.float64)
+        vertices[:, :, 0] = coords[np.newaxis, :]
+        vertices[:, :, 1] = rowCoords[:, np.newaxis]
+        vertices[:, :, 2] = heights
+        vertices = vertices.reshape(-1, 3)
+
+        corner = (np.arange(numRows - 1)[:, np.newaxis] * numVertices
+                  + np.arange(numVertices - 1)[np.newaxis, :]).reshape(-1)
+        triangles = np.empty((corner.size * 2, 3), dtype=np.int64)
+        triangles[0::2, 0] = corner
+        triangles[0::2, 1] = corner + 1
+        triangles[0::2, 2] = corner + numVertices + 1
+        triangles[1::2, 0] = corner
+        triangles[1::2, 1] = corner + numVertices + 1
+        triangles[1::2, 2] = corner + numVertices
+    else:
+        vertices = [(j * spacing, (firstRow + i) * spacing, heightMap[i][j])
+                    for i in range(numRows) for j in range(numVertices)]
+        triangles = []
+        for i in range(numRows - 1):
+            for j in range(numVertices - 1):
+                corner = i * numVertices + j
+                triangles.append((corner, corner + 1, corner + numVertices + 1))
+                triangles.append((corner, corner + numVertices + 1, corner + numVertices))
+
+    return TriangleMesh(vertices, triangles, gridBorder(numVertices, numRows))
+
+
+def closeMesh(surface, baseHeight):
+    # Close a surface mesh into a solid: a vertical skirt from every border edge
+    # down to baseHeight and a flat base fanned from its centre
+    border = surface.border
+    count = len(border)
+
+    if np is not None and isinstance(surface.vertices, np.ndarray):
+        borderIndices = np.asarray(border, dtype=np.int64)
+        baseVertices = surface.vertices[borderIndices].copy()
+        baseVertices[:, 2] = baseHeight
+        center = baseVertices.mean(axis=0)
+        vertices = np.vstack([surface.vertices, baseVertices, center[np.newaxis, :]])
+
+        top = borderIndices
+        nextTop = np.roll(borderIndices, -1)
+        base = len(surface.vertices) + np.arange(count)
+        nextBase = np.roll(base, -1)
+        centerIndex = np.full(count, len(vertices) - 1)
+
+        triangles = np.vstack([
+            surface.triangles,
+            np.column_stack([top, nextBase, nextTop]),
+            np.column_stack([top, base, nextBase]),
+            np.column_stack([centerIndex, nextBase, base]),
+        ])
+    else:
+        vertices = list(surface.vertices)
+        triangles = list(surface.triangles)
+        firstBase = len(vertices)
+        sumX = sumY = 0.0
+        for index in border:
+            x, y, _ = surface.vertices[index]
+            vertices.append((x, y, baseHeight))
+            sumX += x
+            sumY += y
+        vertices.append((sumX / count, sumY / count, baseHeight))
+        centerIndex = len(vertices) - 1
+
+        for k in range(count):
+            top = border[k]
+            nextTop = border[(k + 1) % count]
+            base = firstBase + k
+            nextBase = firstBase + (k + 1) % count
+            triangles.append((top, nextBase, nextTop))
+            triangles.append((top, base, nextBase))
+            triangles.append((centerIndex, nextBase, base))
+
+    return TriangleMesh(vertices, triangles, [])
+
+
+def terrainSolidMesh(heightMap, size, baseHeight):
+    # Closed terrain mesh for a height map
+    return closeMesh(gridMesh(heightMap, size), baseHeight)
+
+
+def tiledGridMeshes(tiledHeightMap, size, heightScale=1.0):
+    # Surface mesh for every tile of a tiles.TiledHeightMap, in row order.
+    # Consecutive tiles share a row of vertices so the strips join seamlessly.
+    for rowStart, rows in tiledHeightMap.tiles(overlap=True, heightScale=heightScale):
+        yield gridMesh(rows, size, rowStart)
@@ -0,0 +1,133 @@
+"""Seeded gradient (Perlin) noise for the terrain generator.
+
+Each seed gets its own permutation and gradient tables. Building them is the
+only place trigonometry is used; the tables are kept in a small LRU so changing
+the seed back and forth in the dialog does not rebuild them, and evaluating the
+noise is reduced to table lookups and a few multiplies per lattice corner.
+"""
+
+import functools
+import math
+import random
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Size of the permutation table; lattice coordinates wrap at this period
+PERMUTATION_SIZE = 256
+
+# Number of per-octave sample offsets stored with each table
+MAX_OCTAVES = 16
+
+# Number of seeds whose tables are kept in memory
+TABLE_CACHE_SIZE = 8
+
+# Perlin noise in 2D stays within +/- sqrt(0.5); scale the result to [-1, 1]
+_NOISE_SCALE = math.sqrt(2)
+
+
+@functools.lru_cache(maxsize=TABLE_CACHE_SIZE)
+def permutationTables(seed):
+    # Build the permutation, gradient and octave offset tables for a seed.
+    # The permutation is stored twice so corner lookups never need to wrap.
+    rng = random.Random(seed)
+
+    permutation = list(range(PERMUTATION_SIZE))
+    rng.shuffle(permutation)
+
+    gradientX = []
+    gradientY = []
+    for _ in range(PERMUTATION_SIZE):
+        angle = rng.uniform(0, 2 * math.pi)
+        gradientX.append(math.cos(angle))
+        gradientY.append(math.sin(angle))
+
+    # Shift every octave by a random fraction of a cell so that octaves are
+    # decorrelated and grid points do not all land on zero-valued lattice corners
+    offsets = tuple((rng.random() * PERMUTATION_SIZE, rng.random() * PERMUTATION_SIZE)
+                    for _ in range(MAX_OCTAVES))
+
+    return tuple(permutation * 2), tuple(gradientX), tuple(gradientY), offsets
+
+
+@functools.lru_cache(maxsize=TABLE_CACHE_SIZE)
+def _arrayTables(seed):
+    # NumPy copies of the tables for the vectorized noise
+    permutation, gradientX, gradientY, offsets = permutationTables(seed)
+    return (np.array(permutation, dtype=np.intp),
+            np.array(gradientX, dtype=np.float64),
+            np.array(gradientY, dtype=np.float64),
+            offsets)
+
+
+def octaveOffset(seed, octave):
+    # Sample offset for an octave of the given seed
+    offsets = permutationTables(seed)[3]
+    return offsets[octave % MAX_OCTAVES]
+
+
+def perlin2D(x, y, seed):
+    # Gradient noise in [-1, 1] for a single point
+    permutation, gradientX, gradientY, _ = permutationTables(seed)
+
+    x0 = math.floor(x)
+    y0 = math.floor(y)
+    xf = x - x0
+    yf = y - y0
+    xi = x0 & (PERMUTATION_SIZE - 1)
+    yi = y0 & (PERMUTATION_SIZE - 1)
+
+    a = permutation[xi] + yi
+    b = permutation[xi + 1] + yi
+    h00 = permutation[a]
+    h01 = permutation[a + 1]
+    h10 = permutation[b]
+    h11 = permutation[b + 1]
+
+    n00 = gradientX[h00] * xf + gradientY[h00] * yf
+    n10 = gradientX[h10] * (xf - 1) + gradientY[h10] * yf
+    n01 = gradientX[h01] * xf + gradientY[h01] * (yf - 1)
+    n11 = gradientX[h11] * (xf - 1) + gradientY[h11] * (yf - 1)
+
+    u = _fade(xf)
+    v = _fade(yf)
+    nx0 = n00 + u * (n10 - n00)
+    nx1 = n01 + u * (n11 - n01)
+    return (nx0 + v * (nx1 - nx0)) * _NOISE_SCALE
+
+
+def perlinArray(x, y, seed):
+    # Vectorized perlin2D; x and y are arrays that broadcast against each other
+    permutation, gradientX, gradientY, _ = _arrayTables(seed)
+
+    x0 = np.floor(x)
+    y0 = np.floor(y)
+    xf = x - x0
+    yf = y - y0
+    xi = x0.astype(np.intp) & (PERMUTATION_SIZE - 1)
+    yi = y0.astype(np.intp) & (PERMUTATION_SIZE - 1)
+
+    a = permutation[xi] + yi
+    b = permutation[xi + 1] + yi
+    h00 = permutation[a]
+    h01 = permutation[a + 1]
+    h10 = permutation[b]
+    h11 = permutation[b + 1]
+
+    n00 = gradientX[h00] * xf + gradientY[h00] * yf
+    n10 = gradientX[h10] * (xf - 1) + gradientY[h10] * yf
+    n01 = gradientX[h01] * xf + gradientY[h01] * (yf - 1)
+    n11 = gradientX[h11] * (xf - 1) + gradientY[h11] * (yf - 1)
+
+    u = _fade(xf)
+    v = _fade(yf)
+    nx0 = n00 + u * (n10 - n00)
+    nx1 = n01 + u * (n11 - n01)
+    return (nx0 + v * (nx1 - nx0)) * _NOISE_SCALE
+
+
+def _fade(t):
+    # Quintic fade curve 6t^5 - 15t^4 + 10t^3 (works on floats and arrays)
+    return t * t * t * (t * (t * 6 - 15) + 10)
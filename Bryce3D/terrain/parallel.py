@@ -0,0 +1,183 @@
+"""Multi-core generation of tiled height maps.
+
+Tiles are split across worker processes that all write into the same memory
+mapped file (see terrain.worker). This is used for both noise generation and
+erosion. Every tile is computed by the same function as in the serial path and
+tiles never overlap, so the result is identical no matter how many workers are
+used or in which order they finish.
+
+Inside Fusion sys.executable is Fusion itself, so the workers are started with
+the Python interpreter that ships next to it rather than through
+multiprocessing. When no interpreter can be found, or only one worker is
+wanted, the tiles are generated serially in this process.
+"""
+
+import json
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+
+from . import tiles
+
+# Folder that contains the terrain package; workers run from here
+_PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def defaultWorkerCount():
+    # Leave one core for Fusion's UI thread
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def pythonExecutable():
+    # Path of a Python interpreter that can run the worker module, or None
+    name = os.path.basename(sys.executable).lower()
+    if name.startswith('python'):
+        return sys.executable
+
+    candidates = [
+        os.path.join(sys.exec_prefix, 'python.exe'),
+        os.path.join(sys.exec_prefix, 'python'),
+        os.path.join(sys.exec_prefix, 'bin', 'python3'),
+        os.path.join(sys.exec_prefix, 'bin', 'python'),
+        os.path.join(sys.prefix, 'Python', 'python.exe'),
+    ]
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def generateTiled(tiledMap, roughness, seed, workers=None, progress=None):
+    # Fill in the missing tiles of a tiles.TiledHeightMap using several processes.
+    # progress works as in TiledHeightMap.generate; returning False stops the
+    # workers and keeps the finished tiles. Returns True when the map is complete.
+    job = {
+        'stage': 'noise',
+        'roughness': roughness,
+        'seed': seed,
+    }
+    parameters = tiles.generatorParameters(roughness, seed)
+    completed = tiledMap.prepare(parameters)
+    return _runTiles(tiledMap, completed, parameters, job, workers, progress,
+                     lambda: tiledMap.generate(roughness, seed, progress))
+
+
+def erodeTiled(tiledMap, source, parameters, thermalIterations, hydraulicIterations, workers=None, progress=None):
+    # Erode a finished tiled height map into tiledMap using several processes,
+    # one erosion pass at a time. parameters identify the eroded result; see
+    # TiledHeightMap.erodeFrom.
+    passes = tiledMap.erosionPasses(thermalIterations, hydraulicIterations)
+    states = tiledMap.erosionStates(source, passes)
+    for index in range(tiledMap.firstErosionPass(parameters, len(passes)), len(passes)):
+        passParameters = tiledMap.passParameters(parameters, index, len(passes))
+        completed = tiledMap.preparePass(passParameters, states[index + 1])
+        passProgress = tiles.passProgress(progress, index, len(passes))
+        job = {
+            'stage': 'erode',
+            'source': states[index],
+            'target': states[index + 1],
+            'thermalIterations': passes[index][0],
+            'hydraulicIterations': passes[index][1],
+        }
+        if not _runTiles(tiledMap, completed, passParameters, job, workers, passProgress,
+                         lambda: tiledMap.erodePass(states[index], states[index + 1], passes[index],
+                                                    completed, passParameters, passProgress)):
+            return False
+    tiledMap.removeScratch()
+    return True
+
+
+def _runTiles(tiledMap, completed, parameters, job, workers, progress, runSerial):
+    if workers is None or workers <= 0:
+        workers = defaultWorkerCount()
+    missing = [tile for tile in range(tiledMap.tileCount) if tile not in completed]
+    if not missing:
+        return True
+
+    python = pythonExecutable()
+    workers = min(workers, len(missing))
+    if python is None or workers <= 1:
+        return runSerial()
+
+    # Interleave the tiles so every worker gets a similar share of the rows
+    jobs = []
+    for worker in range(workers):
+        workerJob = dict(job)
+        workerJob.update({
+            'path': os.path.abspath(tiledMap.path),
+            'numVertices': tiledMap.numVertices,
+            'tileRows': tiledMap.tileRows,
+            'tiles': missing[worker::workers],
+        })
+        jobs.append(workerJob)
+
+    finishedTiles = queue.Queue()
+    processes = [_startWorker(python, workerJob, finishedTiles) for workerJob in jobs]
+    stopped = False
+    try:
+        running = len(processes)
+        while running:
+            try:
+                tile = finishedTiles.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if tile is None:
+                running -= 1
+                continue
+
+            completed.add(tile)
+            tiledMap.saveProgress(completed, parameters)
+            if progress is not None and progress(len(completed), tiledMap.tileCount) is False:
+                stopped = True
+                break
+    finally:
+        for process in processes:
+            if stopped and process.poll() is None:
+                process.kill()
+            process.wait()
+
+    try:
+        if not stopped:
+            for process in processes:
+                if process.returncode != 0:
+                    process.errorFile.seek(0)
+                    raise RuntimeError('Terrain worker failed:\n{}'.format(process.errorFile.read()))
+    finally:
+        for process in processes:
+            process.errorFile.close()
+    return len(completed) == tiledMap.tileCount
+
+
+def _startWorker(python, job, finishedTiles):
+    # Start a worker and forward the tiles it reports to finishedTiles,
+    # followed by None when its output ends. Its error output goes to a
+    # temporary file, kept as process.errorFile, so a worker that writes a lot
+    # of warnings can never block on a full pipe.
+    creationFlags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+    errorFile = tempfile.TemporaryFile(mode='w+')
+    try:
+        process = subprocess.Popen(
+            [python, '-m', 'terrain.worker', json.dumps(job)],
+            cwd=_PACKAGE_PARENT,
+            stdout=subprocess.PIPE,
+            stderr=errorFile,
+            universal_newlines=True,
+            creationflags=creationFlags)
+    except Exception:
+        errorFile.close()
+        raise
+    process.errorFile = errorFile
+
+    def readOutput():
+        for line in process.stdout:
+            line = line.strip()
+            if line:
+                finishedTiles.put(int(line))
+        finishedTiles.put(None)
+
+    thread = threading.Thread(target=readOutput, daemon=True)
+    thread.start()
+    return process
@@ -0,0 +1,96 @@
+"""Terrain generation pipeline without any Fusion dependencies.
+
+The stages the add-in runs when it builds a terrain, as plain functions that
+can be called from any Python process:
+
+    generate   height map from the chosen generator
+    erode      optional thermal and hydraulic erosion
+    mesh       closed triangle mesh, optionally simplified to a maximum error
+    write      height map (.f32) and mesh (.stl or .obj) files
+
+Each function accepts an optional timings dict and adds the wall clock time of
+its stage to it, which is what the command line benchmark reports.
+"""
+
+import array
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from . import heightmap
+from . import erosion
+from . import mesh
+from . import simplify
+from . import exporter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Depth of the terrain base below the lowest point, as a fraction of the height scale
+BASE_DEPTH = 0.01
+
+
+def baseHeight(heightScale):
+    # Height of the flat base the terrain is closed against
+    return -heightScale * BASE_DEPTH
+
+
+def generateTerrain(detailLevel, heightScale, roughness, seed, generator=heightmap.PERLIN,
+                    thermalIterations=0, hydraulicIterations=0, timings=None):
+    # Height map for the parameters of the terrain dialog
+    numVertices = heightmap.gridSize(detailLevel)
+    with _timed(timings, 'generate'):
+        heightMap = heightmap.generateHeightMap(numVertices, heightScale, roughness, seed, generator)
+    if thermalIterations > 0 or hydraulicIterations > 0:
+        with _timed(timings, 'erode'):
+            heightMap = erosion.erode(heightMap, thermalIterations, hydraulicIterations, heightScale)
+    return heightMap
+
+
+def buildMesh(heightMap, size, heightScale, maxError=0, timings=None):
+    # Close the height map into a solid triangle mesh below the lowest point,
+    # simplified to maxError when the adaptive mesher can handle the grid
+    with _timed(timings, 'mesh'):
+        if maxError > 0 and simplify.isSupported(len(heightMap)):
+            surface = simplify.simplifiedMesh(heightMap, size, maxError)
+            return mesh.closeMesh(surface, baseHeight(heightScale))
+        return mesh.terrainSolidMesh(heightMap, size, baseHeight(heightScale))
+
+
+def writeHeightMap(path, heightMap, timings=None):
+    # Raw little-endian float32 grid, readable again with terrain.importer
+    with _timed(timings, 'write'):
+        if np is not None:
+            np.asarray(heightMap, dtype='<f4').tofile(path)
+        else:
+            values = array.array('f', (value for row in heightMap for value in row))
+            if sys.byteorder == 'big':
+                values.byteswap()
+            with open(path, 'wb') as heightFile:
+                values.tofile(heightFile)
+
+
+def writeMesh(path, heightMap, size, heightScale, maxError=0, terrainMesh=None, scale=1.0, timings=None):
+    # STL or OBJ file chosen by extension; the full grid is streamed unless a
+    # simplified mesh is requested
+    with _timed(timings, 'write'):
+        if maxError > 0:
+            if terrainMesh is None:
+                terrainMesh = buildMesh(heightMap, size, heightScale, maxError)
+            exporter.exportMesh(path, terrainMesh, scale)
+        else:
+            exporter.exportHeightMap(path, heightMap, size, baseHeight(heightScale), scale)
+    return os.path.getsize(path)
+
+
+@contextmanager
+def _timed(timings, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
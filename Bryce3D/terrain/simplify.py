@@ -0,0 +1,207 @@
+"""Error-bounded adaptive triangulation of height maps.
+
+Uses a right-triangulated irregular network (RTIN): the grid is split into two
+right triangles which are recursively bisected along their long edge. The
+largest vertical distance between every possible triangle and the grid points
+it covers is computed once, bottom-up, and a mesh for any maximum error is then extracted top-down by only splitting
+triangles whose error is too large. Neighbouring triangles always share their
+split vertices, so the result is crack free.
+
+Both passes work on all triangles of one tree level at a time with NumPy, so
+the cost is a few array operations per level rather than a Python call per
+triangle. Requires NumPy and a 2^k + 1 grid, which every generator produces.
+"""
+
+from .mesh import TriangleMesh
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Largest number of grid heights gathered at once when measuring triangle errors
+PLANE_ERROR_BLOCK = 1 << 20
+
+
+def isSupported(numVertices):
+    # True when NumPy is available and the grid size is a power of two plus one
+    cells = numVertices - 1
+    return np is not None and cells > 0 and cells & (cells - 1) == 0
+
+
+def bisectionErrors(heightMap):
+    # Largest vertical distance between each triangle's plane and the grid
+    # points it covers, stored at its hypotenuse midpoint and propagated so a
+    # parent's error is never smaller than its children's
+    heights = np.asarray(heightMap, dtype=np.float64)
+    numVertices = heights.shape[0]
+    if not isSupported(numVertices):
+        raise ValueError('Adaptive meshing needs NumPy and a 2^k + 1 grid, got {}'.format(numVertices))
+
+    cells = numVertices - 1
+    flatHeights = heights.reshape(-1)
+    errors = np.zeros(numVertices * numVertices, dtype=np.float64)
+
+    # Triangle ids 2 .. 2 * cells^2 - 1 form an implicit binary tree; ids with
+    # the same bit length are on the same level. Deepest level first.
+    lastId = 2 * cells * cells - 1
+    deepest = lastId.bit_length()
+    for level in range(deepest, 1, -1):
+        ids = np.arange(1 << (level - 1), min(1 << level, lastId + 1), dtype=np.int64)
+        ax, ay, bx, by, cx, cy = _triangleCorners(ids, level, cells)
+
+        middle = ((ay + by) >> 1) * numVertices + ((ax + bx) >> 1)
+        middleError = _planeErrors(flatHeights, numVertices, ax, ay, bx, by, cx, cy)
+
+        if level < deepest:
+            leftChild = ((ay + cy) >> 1) * numVertices + ((ax + cx) >> 1)
+            rightChild = ((by + cy) >> 1) * numVertices + ((bx + cx) >> 1)
+            middleError = np.maximum(middleError, np.maximum(errors[leftChild], errors[rightChild]))
+
+        # Two triangles share each long edge, so scatter with a max
+        np.maximum.at(errors, middle, middleError)
+
+    return errors.reshape(numVertices, numVertices)
+
+
+def simplifiedMesh(heightMap, size, maxError, errors=None):
+    # Surface mesh whose vertical distance to the height map is at most maxError
+    # at every grid point.
+    # Pass the result of bisectionErrors to reuse it across several maxError values.
+    heights = np.asarray(heightMap, dtype=np.float64)
+    numVertices = heights.shape[0]
+    cells = numVertices - 1
+    if errors is None:
+        errors = bisectionErrors(heights)
+    flatErrors = errors.reshape(-1)
+
+    # Start from the two root triangles and split level by level
+    ax = np.array([0, cells])
+    ay = np.array([0, cells])
+    bx = np.array([cells, 0])
+    by = np.array([cells, 0])
+    cx = np.array([cells, 0])
+    cy = np.array([0, cells])
+
+    finished = []
+    while len(ax):
+        mx = (ax + bx) >> 1
+        my = (ay + by) >> 1
+        split = (np.abs(ax - cx) + np.abs(ay - cy) > 1) & (flatErrors[my * numVertices + mx] > maxError)
+
+        keep = ~split
+        # RTIN corners run clockwise in grid coordinates; emit a, c, b for counter-clockwise
+        finished.append(np.column_stack([ay[keep] * numVertices + ax[keep],
+                                         cy[keep] * numVertices + cx[keep],
+                                         by[keep] * numVertices + bx[keep]]))
+
+        ax, ay, bx, by, cx, cy, mx, my = (values[split] for values in (ax, ay, bx, by, cx, cy, mx, my))
+        # Children (c, a, m) and (b, c, m)
+        ax, ay, bx, by, cx, cy = (np.concatenate([cx, bx]), np.concatenate([cy, by]),
+                                  np.concatenate([ax, cx]), np.concatenate([ay, cy]),
+                                  np.concatenate([mx, mx]), np.concatenate([my, my]))
+
+    gridTriangles = np.vstack(finished)
+
+    # Keep only the grid points that are used and renumber them
+    used, triangles = np.unique(gridTriangles, return_inverse=True)
+    triangles = triangles.reshape(-1, 3)
+    rows = used // numVertices
+    columns = used % numVertices
+
+    spacing = size / cells
+    vertices = np.column_stack([columns * spacing, rows * spacing, heights.reshape(-1)[used]])
+
+    return TriangleMesh(vertices, triangles, _usedBorder(rows, columns, cells))
+
+
+def _triangleCorners(ids, level, cells):
+    # Decode corner grid coordinates for triangle ids that all have the given bit length
+    odd = (ids & 1).astype(bool)
+    ax = np.where(odd, 0, cells)
+    ay = ax.copy()
+    bx = np.where(odd, cells, 0)
+    by = bx.copy()
+    cx = np.where(odd, cells, 0)
+    cy = np.where(odd, 0, cells)
+
+    ids = ids >> 1
+    for _ in range(level - 2):
+        mx = (ax + bx) >> 1
+        my = (ay + by) >> 1
+        left = (ids & 1).astype(bool)
+        ax, ay, bx, by = (np.where(left, cx, bx), np.where(left, cy, by),
+                          np.where(left, ax, cx), np.where(left, ay, cy))
+        cx = mx
+        cy = my
+        ids = ids >> 1
+
+    return ax, ay, bx, by, cx, cy
+
+
+def _planeErrors(flatHeights, numVertices, ax, ay, bx, by, cx, cy):
+    # Largest vertical distance between each triangle's plane and the grid
+    # points inside it. All triangles of a level are congruent, so those with
+    # the same leg directions share one list of covered offsets from c.
+    errors = np.zeros(len(ax), dtype=np.float64)
+    ux = ax - cx
+    uy = ay - cy
+    vx = bx - cx
+    vy = by - cy
+    # Legs of one level all have the same length, so their signs tell the
+    # shapes apart
+    shapeOf = (np.sign(ux) * 27 + np.sign(uy) * 9 + np.sign(vx) * 3 + np.sign(vy)).astype(np.int64) + 40
+    for shape in np.flatnonzero(np.bincount(shapeOf)):
+        triangles = np.flatnonzero(shapeOf == shape)
+        first = triangles[0]
+        sux, suy, svx, svy = int(ux[first]), int(uy[first]), int(vx[first]), int(vy[first])
+        dx, dy, alpha, beta = _coveredOffsets(sux, suy, svx, svy)
+        corner = cy[triangles] * numVertices + cx[triangles]
+        cornerHeights = flatHeights[corner]
+        alongU = flatHeights[ay[triangles] * numVertices + ax[triangles]] - cornerHeights
+        alongV = flatHeights[by[triangles] * numVertices + bx[triangles]] - cornerHeights
+        offsets = dy * numVertices + dx
+
+        # Bound the (triangles, offsets) blocks for the large top levels
+        offsetStep = min(len(offsets), PLANE_ERROR_BLOCK)
+        triangleStep = max(1, PLANE_ERROR_BLOCK // offsetStep)
+        for start in range(0, len(triangles), triangleStep):
+            rows = slice(start, start + triangleStep)
+            worst = np.zeros(len(corner[rows]), dtype=np.float64)
+            for offsetStart in range(0, len(offsets), offsetStep):
+                columns = slice(offsetStart, offsetStart + offsetStep)
+                covered = flatHeights[corner[rows, None] + offsets[None, columns]]
+                plane = (cornerHeights[rows, None] + alongU[rows, None] * alpha[None, columns] +
+                         alongV[rows, None] * beta[None, columns])
+                worst = np.maximum(worst, np.abs(covered - plane).max(axis=1))
+            errors[triangles[rows]] = worst
+    return errors
+
+
+def _coveredOffsets(ux, uy, vx, vy):
+    # Grid offsets from the right-angle corner that lie inside the triangle
+    # (0, u, v), with their barycentric weights along u and v
+    xs = np.arange(min(0, ux, vx), max(0, ux, vx) + 1)
+    ys = np.arange(min(0, uy, vy), max(0, uy, vy) + 1)
+    dx, dy = (values.reshape(-1) for values in np.meshgrid(xs, ys))
+    determinant = ux * vy - vx * uy
+    alpha = (dx * vy - vx * dy) / determinant
+    beta = (ux * dy - dx * uy) / determinant
+    inside = (alpha >= -1e-9) & (beta >= -1e-9) & (alpha + beta <= 1 + 1e-9)
+    return dx[inside], dy[inside], alpha[inside], beta[inside]
+
+
+def _usedBorder(rows, columns, cells):
+    # Indices into the used vertices that lie on the grid edge, in the same
+    # counter-clockwise order as mesh.gridBorder
+    indices = np.arange(len(rows))
+    bottom = indices[(rows == 0) & (columns < cells)]
+    right = indices[(columns == cells) & (rows < cells)]
+    top = indices[(rows == cells) & (columns > 0)]
+    left = indices[(columns == 0) & (rows > 0)]
+
+    bottom = bottom[np.argsort(columns[bottom])]
+    right = right[np.argsort(rows[right])]
+    top = top[np.argsort(-columns[top])]
+    left = left[np.argsort(-rows[left])]
+    return np.concatenate([bottom, right, top, left]).tolist()
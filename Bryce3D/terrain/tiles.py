@@ -0,0 +1,361 @@
+"""Tiled, memory-mapped height maps for very large terrains.
+
+A TiledHeightMap is a raw little-endian float32 file holding the whole grid,
+filled one tile (a band of rows) at a time through np.memmap, so only a single
+tile is ever held as a NumPy array. Completed tiles are recorded in a small JSON
+file next to the data, which makes generation resumable: running it again with
+the same parameters only computes the tiles that are still missing.
+
+Consumers read the finished map tile by tile with tiles(), or as one read-only
+memmap that the exporter can stream row by row. Only the Perlin generator can
+be tiled because diamond-square needs the whole grid at every level.
+
+Erosion reads a finished map and writes a second one, eroding each tile with
+enough rows of context around it that the result matches eroding the whole map.
+It runs in passes of a few iterations, keeping the heights, water and sediment
+between passes in float64 scratch files next to the result, so every tile only
+needs half a tile of context and memory stays bounded at any iteration count.
+
+Tiled maps are stored at unit height scale, like the in-memory cache, and the
+height scale is applied when they are read, so rescaling a terrain never
+regenerates it. evictTiledMaps keeps a folder of them under a byte budget.
+"""
+
+import json
+import os
+
+from . import heightmap
+from . import erosion
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Rows per tile; a tile of a 4097 wide grid is about 1 MB of float32
+DEFAULT_TILE_ROWS = 64
+
+# File extension of tiled height map data files
+TILE_FILE_EXTENSION = '.f32'
+
+# Fields of the grid state kept between erosion passes
+SCRATCH_FIELDS = ('heights', 'water', 'sediment')
+
+
+class TiledHeightMap:
+    def __init__(self, path, numVertices, tileRows=DEFAULT_TILE_ROWS):
+        if np is None:
+            raise RuntimeError('Tiled height maps need NumPy.')
+        self.path = path
+        self.progressPath = path + '.json'
+        self.numVertices = numVertices
+        self.tileRows = tileRows
+
+    @property
+    def tileCount(self):
+        return (self.numVertices + self.tileRows - 1) // self.tileRows
+
+    def tileRange(self, tile):
+        # First and one-past-last row of a tile
+        rowStart = tile * self.tileRows
+        return rowStart, min(rowStart + self.tileRows, self.numVertices)
+
+    def completedTiles(self, parameters=None):
+        # Tiles already written for these parameters; nothing is complete if the
+        # file was written for a different grid, tile size or parameter set
+        try:
+            with open(self.progressPath, 'r') as progressFile:
+                progress = json.load(progressFile)
+        except (OSError, ValueError):
+            return set()
+        if (progress.get('numVertices') != self.numVertices or progress.get('tileRows') != self.tileRows
+                or progress.get('parameters') != parameters or not os.path.exists(self.path)):
+            return set()
+        return set(progress.get('completed', []))
+
+    def isComplete(self, parameters=None):
+        return len(self.completedTiles(parameters)) == self.tileCount
+
+    def generate(self, roughness, seed, progress=None):
+        # Fill in every missing tile with the Perlin generator. progress is called
+        # as progress(tilesDone, tileCount) after each tile and may return False to
+        # stop early; the tiles written so far are kept. Returns True when complete.
+        parameters = generatorParameters(roughness, seed)
+        completed = self.prepare(parameters)
+        if len(completed) == self.tileCount:
+            return True
+
+        heights = np.memmap(self.path, dtype='<f4', mode='r+', shape=(self.numVertices, self.numVertices))
+        try:
+            for tile in range(self.tileCount):
+                if tile in completed:
+                    continue
+                self.generateTile(heights, tile, roughness, seed)
+                heights.flush()
+
+                completed.add(tile)
+                self.saveProgress(completed, parameters)
+                if progress is not None and progress(len(completed), self.tileCount) is False:
+                    break
+        finally:
+            del heights
+
+        return len(completed) == self.tileCount
+
+    def generateTile(self, heights, tile, roughness, seed):
+        # Compute one tile at unit height scale into an open memmap of this height map
+        rowStart, rowStop = self.tileRange(tile)
+        heights[rowStart:rowStop] = heightmap.generateRows(
+            self.numVertices, 1.0, roughness, seed, rowStart, rowStop)
+
+    def erodeFrom(self, source, parameters, thermalIterations, hydraulicIterations, progress=None):
+        # Fill in this map with the eroded tiles of a finished source map.
+        # parameters identify the result; progress works as in generate, counting
+        # the tiles of every pass. Returns True when complete.
+        passes = self.erosionPasses(thermalIterations, hydraulicIterations)
+        states = self.erosionStates(source, passes)
+        for index in range(self.firstErosionPass(parameters, len(passes)), len(passes)):
+            passParameters = self.passParameters(parameters, index, len(passes))
+            completed = self.preparePass(passParameters, states[index + 1])
+            if not self.erodePass(states[index], states[index + 1], passes[index], completed, passParameters,
+                                  passProgress(progress, index, len(passes))):
+                return False
+        self.removeScratch()
+        return True
+
+    def erosionPasses(self, thermalIterations, hydraulicIterations):
+        # Erosion runs a few iterations at a time so a tile needs at most half a
+        # tile of context rows on each side, however many iterations there are
+        return erosion.erosionPasses(thermalIterations, hydraulicIterations, max(1, self.tileRows // 4))
+
+    def erosionStates(self, source, passes):
+        # Files each pass reads and writes, as {field: [path, dtype]}. The first
+        # pass reads the source map and the last writes this one; the passes in
+        # between alternate between two sets of float64 scratch files, which hold
+        # the water and sediment as well once hydraulic erosion has started.
+        states = [{'heights': [source.path, '<f4']}]
+        fields = ('heights',)
+        for index, (thermalIterations, hydraulicIterations) in enumerate(passes):
+            if hydraulicIterations > 0:
+                fields = SCRATCH_FIELDS
+            if index == len(passes) - 1:
+                states.append({'heights': [self.path, '<f4']})
+            else:
+                states.append({field: [self.scratchPath(index % 2, field), '<f8'] for field in fields})
+        return states
+
+    def scratchPath(self, parity, field):
+        return '{}.pass{}.{}'.format(self.path, parity, field)
+
+    def passParameters(self, parameters, index, passCount):
+        # Progress parameters of an erosion pass; the last pass records the
+        # parameters of the finished map
+        if index == passCount - 1:
+            return parameters
+        return parameters + ['pass', index]
+
+    def firstErosionPass(self, parameters, passCount):
+        # Pass to resume from: the one recorded in the progress file, or the one
+        # after it if it was finished
+        for index in range(passCount - 1, -1, -1):
+            completed = self.completedTiles(self.passParameters(parameters, index, passCount))
+            if completed:
+                if len(completed) == self.tileCount and index < passCount - 1:
+                    return index + 1
+                return index
+        return 0
+
+    def preparePass(self, passParameters, fields):
+        # Make sure the files an erosion pass writes exist with the right size
+        # and return the tiles of the pass that are already done
+        completed = self.completedTiles(passParameters)
+        shape = (self.numVertices, self.numVertices)
+        if completed and all(os.path.exists(path) and os.path.getsize(path) == np.dtype(dtype).itemsize * shape[0] * shape[1]
+                             for path, dtype in fields.values()):
+            return completed
+
+        for path, dtype in fields.values():
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            heights = np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+            del heights
+        self.saveProgress(set(), passParameters)
+        return set()
+
+    def erodePass(self, sourceFields, targetFields, iterations, completed, passParameters, progress=None):
+        # Erode every missing tile of one pass. Returns True when the pass is complete.
+        sourceArrays = openFields(sourceFields, self.numVertices, 'r')
+        targetArrays = openFields(targetFields, self.numVertices, 'r+')
+        try:
+            for tile in range(self.tileCount):
+                if tile in completed:
+                    continue
+                self.erodeTile(sourceArrays, targetArrays, tile, *iterations)
+                for array in targetArrays.values():
+                    array.flush()
+
+                completed.add(tile)
+                self.saveProgress(completed, passParameters)
+                if progress is not None and progress(len(completed), self.tileCount) is False:
+                    break
+        finally:
+            del targetArrays
+
+        return len(completed) == self.tileCount
+
+    def erodeTile(self, sourceArrays, targetArrays, tile, thermalIterations, hydraulicIterations):
+        # Run one pass of erosion on a tile, reading the open source fields and
+        # writing the target ones. Without water and sediment to write, this is
+        # the last pass and the suspended sediment settles.
+        rowStart, rowStop = self.tileRange(tile)
+        halo = erosion.haloRows(thermalIterations, hydraulicIterations)
+        band = slice(max(0, rowStart - halo), min(self.numVertices, rowStop + halo))
+        water = sourceArrays.get('water')
+        sediment = sourceArrays.get('sediment')
+        heights, water, sediment = erosion.erodeSteps(
+            sourceArrays['heights'][band], None if water is None else water[band], None if sediment is None else sediment[band],
+            thermalIterations, hydraulicIterations, numVertices=self.numVertices)
+
+        inner = slice(rowStart - band.start, rowStop - band.start)
+        if 'water' in targetArrays:
+            targetArrays['water'][rowStart:rowStop] = water[inner]
+            targetArrays['sediment'][rowStart:rowStop] = sediment[inner]
+        elif sediment is not None:
+            heights += sediment
+        targetArrays['heights'][rowStart:rowStop] = heights[inner]
+
+    def removeScratch(self):
+        # Delete the scratch files of tiled erosion
+        for parity in (0, 1):
+            for field in SCRATCH_FIELDS:
+                try:
+                    os.remove(self.scratchPath(parity, field))
+                except OSError:
+                    pass
+
+    def prepare(self, parameters):
+        # Make sure the data file exists with the right size and return the tiles
+        # that are already done for these parameters
+        completed = self.completedTiles(parameters)
+        expectedBytes = self.numVertices * self.numVertices * 4
+        if completed and os.path.getsize(self.path) == expectedBytes:
+            return completed
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        heights = np.memmap(self.path, dtype='<f4', mode='w+', shape=(self.numVertices, self.numVertices))
+        del heights
+        self.saveProgress(set(), parameters)
+        return set()
+
+    def open(self, heightScale=1.0):
+        # The whole height map as a read-only memmap, or as rows scaled to
+        # heightScale. Opening marks the map as recently used for eviction.
+        try:
+            os.utime(self.path)
+        except OSError:
+            pass
+        heights = np.memmap(self.path, dtype='<f4', mode='r', shape=(self.numVertices, self.numVertices))
+        if heightScale == 1.0:
+            return heights
+        return ScaledRows(heights, heightScale)
+
+    def tiles(self, overlap=False, heightScale=1.0):
+        # Yield (rowStart, rows) for every tile in order, scaled to heightScale.
+        # With overlap each tile also includes the first row of the next one, so
+        # that cells between tiles can be built from a single tile.
+        heights = self.open()
+        for tile in range(self.tileCount):
+            rowStart, rowStop = self.tileRange(tile)
+            if overlap:
+                rowStop = min(rowStop + 1, self.numVertices)
+                if rowStop - rowStart < 2:
+                    continue
+            rows = np.array(heights[rowStart:rowStop], dtype=np.float64)
+            rows *= heightScale
+            yield rowStart, rows
+
+    def remove(self):
+        # Delete the data, progress and scratch files
+        for path in (self.path, self.progressPath):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.removeScratch()
+
+    def saveProgress(self, completed, parameters):
+        # Record which tiles are finished for these parameters
+        progress = {
+            'numVertices': self.numVertices,
+            'tileRows': self.tileRows,
+            'parameters': parameters,
+            'completed': sorted(completed),
+        }
+        tempPath = self.progressPath + '.tmp'
+        with open(tempPath, 'w') as progressFile:
+            json.dump(progress, progressFile)
+        os.replace(tempPath, self.progressPath)
+
+
+class ScaledRows:
+    # Read-only rows of a unit height map multiplied by heightScale, for
+    # consumers such as the exporter that read a height map row by row
+    def __init__(self, heights, heightScale):
+        self.heights = heights
+        self.heightScale = heightScale
+
+    def __len__(self):
+        return len(self.heights)
+
+    def __getitem__(self, index):
+        return np.asarray(self.heights[index], dtype=np.float64) * self.heightScale
+
+
+def openFields(fields, numVertices, mode):
+    # Memmaps of {field: [path, dtype]} files holding a whole grid each
+    return {field: np.memmap(path, dtype=dtype, mode=mode, shape=(numVertices, numVertices))
+            for field, (path, dtype) in fields.items()}
+
+
+def passProgress(progress, index, passCount):
+    # Progress callback of one erosion pass that reports the tiles of all passes
+    if progress is None:
+        return None
+    return lambda tilesDone, tileCount: progress(index * tileCount + tilesDone, passCount * tileCount)
+
+
+def generatorParameters(roughness, seed):
+    # Parameters stored with the progress of a tiled height map
+    return [roughness, seed, heightmap.GENERATOR_VERSION]
+
+
+def evictTiledMaps(directory, maxBytes, keep=()):
+    # Delete the least recently used tiled maps in directory, with their progress
+    # files, until the rest fit in maxBytes. Maps whose path is in keep stay.
+    keep = {os.path.abspath(path) for path in keep}
+    maps = []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        if not name.endswith(TILE_FILE_EXTENSION):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        maps.append((stat.st_mtime, stat.st_size, path))
+
+    totalBytes = sum(size for _, size, _ in maps)
+    for _, size, path in sorted(maps):
+        if totalBytes <= maxBytes:
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        TiledHeightMap(path, 0).remove()
+        totalBytes -= size
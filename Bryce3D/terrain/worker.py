@@ -0,0 +1,48 @@
+"""Worker process for parallel terrain generation.
+
+Started by terrain.parallel as
+
+    python -m terrain.worker <job json>
+
+from the add-in folder. The job names a tiled height map file, the stage to run
+(noise generation, or one erosion pass between two sets of grid files) and the
+tiles to compute; each finished tile is written straight into the shared
+memmaps and its index printed on its own line so the parent can record progress.
+"""
+
+import json
+import sys
+
+import numpy as np
+
+from . import tiles
+
+
+def runJob(job):
+    tiledMap = tiles.TiledHeightMap(job['path'], job['numVertices'], job['tileRows'])
+    if job['stage'] == 'erode':
+        source = tiles.openFields(job['source'], tiledMap.numVertices, 'r')
+        targets = tiles.openFields(job['target'], tiledMap.numVertices, 'r+')
+    else:
+        targets = {'heights': np.memmap(tiledMap.path, dtype='<f4', mode='r+',
+                                        shape=(tiledMap.numVertices, tiledMap.numVertices))}
+    try:
+        for tile in job['tiles']:
+            if job['stage'] == 'erode':
+                tiledMap.erodeTile(source, targets, tile, job['thermalIterations'], job['hydraulicIterations'])
+            else:
+                tiledMap.generateTile(targets['heights'], tile, job['roughness'], job['seed'])
+            for target in targets.values():
+                target.flush()
+            print(tile, flush=True)
+    finally:
+        del targets
+
+
+def main(argv):
+    runJob(json.loads(argv[1]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
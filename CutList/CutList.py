@@ -4,21 +4,126 @@ import traceback
 import adsk.core
 import adsk.fusion
 import csv
+import json
 import os
+import time
 from datetime import datetime
 from collections import defaultdict
 # import adsk.cam
 
+from . import stock
+from . import nesting
+from .geometry import oriented_box_extents
+from .grouping import add_cut, cut_rows, CUT_LIST_FIELDS
+from . import writers
+
+try:
+    import numpy as np
+except ImportError:
+    # Without NumPy the world-axis bounding box is used
+    np = None
+
 # Initialize the global variables for the Application and UserInterface objects.
 app = adsk.core.Application.get()
 ui  = app.userInterface
 
+# Body dimensions already measured, keyed by body entity token. Loaded from and
+# saved to a sidecar file next to the cut lists so reruns only measure bodies
+# that are new or changed.
+_dimension_cache = {}
+
+# Time of the current run, recorded on every cache entry it uses
+_run_stamp = 0
+
+# Sidecar file with the measured dimensions, and its format version
+CACHE_FILENAME = 'cut_list_cache.json'
+CACHE_VERSION = 1
+
+# Entries kept in the sidecar file; the least recently seen are dropped first
+MAX_CACHE_ENTRIES = 200000
+
+# Default grouping tolerance in inches offered when the script starts
+DEFAULT_TOLERANCE = 0.01
+
+# Formats the cut list is written in, see writers.WRITERS
+OUTPUT_FORMATS = ('csv', 'json', 'xlsx')
+
+# Saw kerf in inches and the seconds the stock optimizer may spend improving
+# the plans of all profiles together
+SAW_KERF = stock.DEFAULT_KERF
+STOCK_OPTIMIZE_SECONDS = 0.25
+
+# Parts wider than the widest board (a 1x12), or this thin, are cut from sheets
+MAX_BOARD_WIDTH = 11.25
+MAX_SHEET_ONLY_THICKNESS = 0.25
+
+# Sheet parts keep their length along the sheet's length when grain matters
+SHEET_GRAIN_MATTERS = True
+
 def mm_to_inches(mm_value):
     """Convert millimeters to inches and round to 4 decimal places."""
     return round(mm_value / 2.54, 4)
 
 def get_body_dimensions(body):
-    """Calculate the dimensions of a body and return them sorted by length."""
+    """Calculate the dimensions of a body and return them sorted by length.
+
+    Uses the oriented minimum bounding box when NumPy is available, so rotated
+    boards report their true size, and the world-axis bounding box otherwise.
+    Results are cached by entity token together with a fingerprint of the
+    body's geometry, so a body is measured again only when it has changed.
+    """
+    token = body.entityToken
+    fingerprint = body_fingerprint(body)
+    entry = _dimension_cache.get(token)
+    if entry is None or entry['fingerprint'] != fingerprint:
+        if np is None:
+            dimensions = get_axis_aligned_dimensions(body)
+        else:
+            extents = oriented_box_extents(get_body_points(body))
+            dimensions = sorted((mm_to_inches(float(extent)) for extent in extents), reverse=True)
+        entry = {'fingerprint': fingerprint, 'dimensions': dimensions}
+        _dimension_cache[token] = entry
+    entry['seen'] = _run_stamp
+    return list(entry['dimensions'])
+
+def body_fingerprint(body):
+    """Return a cheap summary of a body's geometry that changes when the body is edited."""
+    method = 'aabb' if np is None else 'obb'
+    return [round(body.volume, 6), round(body.area, 6), body.vertices.count, method]
+
+def load_dimension_cache(path):
+    """Load the sidecar cache of measured dimensions, or start empty if it is missing or stale."""
+    global _dimension_cache, _run_stamp
+    _run_stamp = int(datetime.now().timestamp())
+    try:
+        with open(path, 'r') as cache_file:
+            data = json.load(cache_file)
+        _dimension_cache = data['bodies'] if data.get('version') == CACHE_VERSION else {}
+    except (OSError, ValueError, KeyError):
+        _dimension_cache = {}
+
+def save_dimension_cache(path):
+    """Write the cache of measured dimensions next to the cut lists."""
+    bodies = _dimension_cache
+    if len(bodies) > MAX_CACHE_ENTRIES:
+        newest = sorted(bodies, key=lambda token: bodies[token].get('seen', 0), reverse=True)[:MAX_CACHE_ENTRIES]
+        bodies = {token: bodies[token] for token in newest}
+    # Write to a temporary file first so an interrupted run never leaves a broken cache
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as cache_file:
+        json.dump({'version': CACHE_VERSION, 'bodies': bodies}, cache_file)
+    os.replace(temp_path, path)
+
+def get_body_points(body):
+    """Return the vertices of a coarse mesh of the body as an (n, 3) array."""
+    # One call returns every node coordinate, instead of one call per B-rep vertex
+    calculator = body.meshManager.createMeshCalculator()
+    calculator.setQuality(adsk.fusion.TriangleMeshQualityOptions.LowQualityTriangleMesh)
+    mesh = calculator.calculate()
+    return np.array(mesh.nodeCoordinatesAsDouble, dtype=np.float64).reshape(-1, 3)
+
+def get_axis_aligned_dimensions(body):
+    """Calculate the world-axis bounding box dimensions of a body, sorted by length."""
     # Get the bounding box of the body
     bbox = body.boundingBox
     
@@ -33,6 +138,152 @@ def get_body_dimensions(body):
     
     return dimensions
 
+def component_instance_counts(root_component):
+    """Return (component, count) pairs for every component used in the assembly.
+
+    The occurrence tree is a DAG of component definitions, so each component's
+    child occurrences are read once and the counts are pushed down from the
+    root in topological order instead of walking every instance.
+    """
+    # Direct children of each component, one entry per occurrence
+    components = {}
+    children = {}
+    postorder = []
+    stack = [(root_component, False)]
+    while stack:
+        component, expanded = stack.pop()
+        if expanded:
+            postorder.append(component.id)
+            continue
+        if component.id in components:
+            continue
+        components[component.id] = component
+        children[component.id] = [occurrence.component for occurrence in component.occurrences]
+        stack.append((component, True))
+        for child in children[component.id]:
+            if child.id not in components:
+                stack.append((child, False))
+
+    # Reverse postorder puts every parent before its children
+    counts = defaultdict(int)
+    counts[root_component.id] = 1
+    for component_id in reversed(postorder):
+        for child in children[component_id]:
+            counts[child.id] += counts[component_id]
+
+    return [(components[component_id], counts[component_id]) for component_id in reversed(postorder)]
+
+def ask_tolerance():
+    """Ask for the grouping tolerance in inches; returns None if cancelled."""
+    while True:
+        value, cancelled = ui.inputBox('Group parts whose sizes differ by at most (inches, 0 for identical sizes only):',
+                                       'Cut List Tolerance', str(DEFAULT_TOLERANCE))
+        if cancelled:
+            return None
+        try:
+            tolerance = float(value)
+            if tolerance >= 0:
+                return tolerance
+        except ValueError:
+            pass
+        ui.messageBox('Please enter a tolerance of 0 or more inches.')
+
+def is_sheet_part(row):
+    """Return True if the part is cut from sheet goods rather than a board."""
+    return row['Material Width'] > MAX_BOARD_WIDTH or row['Material Height'] <= MAX_SHEET_ONLY_THICKNESS
+
+def plan_sheets(rows):
+    """Nest the sheet part rows onto sheets, one plan per material and thickness.
+
+    Returns a list of ((material, thickness), sheets, oversize).
+    """
+    parts_by_sheet = defaultdict(list)
+    for row in rows:
+        label = f"{row['Body Name']} ({row['Component Name']})"
+        part = (row['Material Width'], row['Length to Cut'], label, not SHEET_GRAIN_MATTERS)
+        parts_by_sheet[(row['Material'], row['Material Height'])].extend([part] * row['QTY'])
+
+    plans = []
+    for sheet_type in sorted(parts_by_sheet):
+        sheets, oversize = nesting.nest_parts(parts_by_sheet[sheet_type], nesting.SHEET_SIZE, SAW_KERF)
+        plans.append((sheet_type, sheets, oversize))
+    return plans
+
+def write_sheet_plan(filepath, plans):
+    """Write one CSV row per nested part with its sheet and position."""
+    with open(filepath, 'w', newline='') as csvfile:
+        fieldnames = ['Material', 'Thickness', 'Sheet', 'Part', 'X', 'Y', 'Width', 'Length', 'Rotated']
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        
+        writer.writeheader()
+        for (material, thickness), sheets, oversize in plans:
+            for number, sheet in enumerate(sheets, 1):
+                for placement in sheet.placements:
+                    writer.writerow({
+                        'Material': material,
+                        'Thickness': thickness,
+                        'Sheet': number,
+                        'Part': placement['label'],
+                        'X': round(placement['x'], 4),
+                        'Y': round(placement['y'], 4),
+                        'Width': placement['width'],
+                        'Length': placement['length'],
+                        'Rotated': 'Yes' if placement['rotated'] else 'No',
+                    })
+            for width, length, label, _ in oversize:
+                writer.writerow({'Material': material, 'Thickness': thickness, 'Sheet': 'Oversize', 'Part': label,
+                                 'Width': width, 'Length': length})
+
+def plan_stock(rows):
+    """Pack the cut list rows into stock boards, one plan per material and cross-section profile.
+
+    Returns a list of (profile, boards, oversize) with profile = (material, width, height).
+    """
+    pieces_by_profile = defaultdict(list)
+    for row in rows:
+        profile = (row['Material'], row['Material Width'], row['Material Height'])
+        label = f"{row['Body Name']} ({row['Component Name']})"
+        pieces_by_profile[profile].extend([(row['Length to Cut'], label)] * row['QTY'])
+
+    # The optimizer time is shared by all profiles; time a profile does not use
+    # carries over to the ones after it
+    deadline = time.perf_counter() + STOCK_OPTIMIZE_SECONDS
+    profiles = sorted(pieces_by_profile)
+    plans = []
+    for position, profile in enumerate(profiles):
+        time_budget = max(0.0, deadline - time.perf_counter()) / (len(profiles) - position)
+        boards, oversize = stock.pack_lengths(pieces_by_profile[profile], stock.STOCK_LENGTHS, SAW_KERF,
+                                              time_budget=time_budget)
+        plans.append((profile, boards, oversize))
+    return plans
+
+def write_stock_plan(filepath, plans):
+    """Write one CSV row per stock board with the pieces to cut from it."""
+    with open(filepath, 'w', newline='') as csvfile:
+        fieldnames = ['Material', 'Material Width', 'Material Height', 'Board', 'Stock Length', 'Cuts', 'Waste']
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        
+        writer.writeheader()
+        for (material, width, height), boards, oversize in plans:
+            for number, board in enumerate(boards, 1):
+                writer.writerow({
+                    'Material': material,
+                    'Material Width': width,
+                    'Material Height': height,
+                    'Board': number,
+                    'Stock Length': board['stock_length'],
+                    'Cuts': '; '.join(f'{length} {label}' for length, label in board['cuts']),
+                    'Waste': board['waste'],
+                })
+            for length, label in oversize:
+                writer.writerow({
+                    'Material': material,
+                    'Material Width': width,
+                    'Material Height': height,
+                    'Board': 'Oversize',
+                    'Cuts': f'{length} {label}',
+                })
+
 def run(_context: str):
     """This function is called by Fusion when the script is run."""
 
@@ -42,62 +293,72 @@ def run(_context: str):
         if not design:
             ui.messageBox('No active design found.')
             return
+        
+        tolerance = ask_tolerance()
+        if tolerance is None:
+            return
+        
+        # Reuse the dimensions measured by earlier runs
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        cache_path = os.path.join(script_dir, CACHE_FILENAME)
+        load_dimension_cache(cache_path)
             
-        # Get all components in the design
-        components = design.allComponents
+        # Get every component used in the assembly with its number of instances
+        components = component_instance_counts(design.rootComponent)
         
         # Use defaultdict to count identical cuts
         cut_counts = defaultdict(int)
         cut_details = {}
         
-        # Process each component
-        for component in components:
+        # Process each component once, however many times it is instanced
+        for component, instance_count in components:
             # Get all bodies in the component
             bodies = component.bRepBodies
             
             for body in bodies:
-                # Get dimensions
-                dimensions = get_body_dimensions(body)
-                length = dimensions[0]  # Longest dimension
-                width = dimensions[1]   # Second longest
-                height = dimensions[2]  # Shortest
-                
-                # Create a key for identical cuts (only using dimensions)
-                cut_key = (width, height, length)
+                # Materials are read in the same pass so the output needs no second walk of the design
+                material = body.material.name if body.material else ''
+                appearance = body.appearance.name if body.appearance else ''
                 
-                # Store the details for this cut (only if we haven't seen these dimensions before)
-                if cut_key not in cut_details:
-                    cut_details[cut_key] = {
-                        'Material Width': width,
-                        'Material Height': height,
-                        'Length to Cut': length,
-                        'Body Name': body.name,
-                        'Component Name': component.name
-                    }
-                
-                # Increment the count for this cut
-                cut_counts[cut_key] += 1
+                # Add one cut per instance of the component
+                add_cut(cut_counts, cut_details, get_body_dimensions(body), body.name, component.name, instance_count,
+                        material, appearance)
+        
+        save_dimension_cache(cache_path)
+        
+        # Merge cuts whose sizes are within the tolerance
+        rows = cut_rows(cut_counts, cut_details, tolerance)
         
-        # Create CSV file
+        # Write the cut list in every output format
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'cut_list_{timestamp}.csv'
+        paths = writers.write_table(os.path.join(script_dir, f'cut_list_{timestamp}'), rows, CUT_LIST_FIELDS, OUTPUT_FORMATS)
+        filename = ', '.join(os.path.basename(path) for path in paths)
         
-        # Get the script directory
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        filepath = os.path.join(script_dir, filename)
+        # Plan which stock boards each piece is cut from
+        plans = plan_stock([row for row in rows if not is_sheet_part(row)])
+        plan_filename = f'cut_plan_{timestamp}.csv'
+        write_stock_plan(os.path.join(script_dir, plan_filename), plans)
+        board_counts = defaultdict(int)
+        for _, boards, _ in plans:
+            for board in boards:
+                board_counts[board['stock_length']] += 1
+        boards_text = ', '.join(f'{count} x {length:g}"' for length, count in sorted(board_counts.items()))
         
-        # Write to CSV
-        with open(filepath, 'w', newline='') as csvfile:
-            fieldnames = ['QTY', 'Material Width', 'Material Height', 'Body Name', 'Component Name', 'Length to Cut']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            writer.writeheader()
-            for cut_key, count in cut_counts.items():
-                row = cut_details[cut_key].copy()
-                row['QTY'] = count
-                writer.writerow(row)
+        # Nest the sheet parts onto sheets of each thickness
+        sheet_plans = plan_sheets([row for row in rows if is_sheet_part(row)])
+        nest_filename = f'nest_plan_{timestamp}.csv'
+        write_sheet_plan(os.path.join(script_dir, nest_filename), sheet_plans)
+        sheet_width, sheet_length = nesting.SHEET_SIZE
+        sheet_summaries = []
+        for (material, thickness), sheets, _ in sheet_plans:
+            name = f'{thickness:g}" {material}' if material else f'{thickness:g}"'
+            sheet_summaries.append(f'{len(sheets)} x {name} ({nesting.sheet_yield(sheets):.0%} yield)')
+        sheets_text = ', '.join(sheet_summaries)
         
-        ui.messageBox(f'Cut list has been created successfully!\nSaved as: {filename}')
+        ui.messageBox(f'Cut list has been created successfully!\nSaved as: {filename}\n'
+                      f'Stock boards: {boards_text or "none"}\nCutting plan saved as: {plan_filename}\n'
+                      f'{sheet_width:g}" x {sheet_length:g}" sheets: {sheets_text or "none"}\n'
+                      f'Nesting plan saved as: {nest_filename}')
         
     except:  #pylint:disable=bare-except
         # Write the error message to the TEXT COMMANDS window.
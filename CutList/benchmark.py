@@ -0,0 +1,313 @@
+"""Headless benchmark of the cut list script.
+
+Run from the folder that contains CutList:
+
+    python -m CutList.benchmark --bodies 1000 10000 100000
+
+Fake adsk.core and adsk.fusion modules are installed in sys.modules before
+CutList.CutList is imported. They model just enough of a design for the
+script: components with occurrences and bodies, and bodies with bounding
+boxes, mesh calculators, materials and appearances. Every attribute read on
+a fake API object is counted as one API call.
+
+For each size a synthetic cabinet assembly is generated: part components
+with one board each, cabinet components made of ten part occurrences, and a
+root with enough cabinet occurrences to reach the requested body count. The
+real run() is executed twice, cold and then with the sidecar cache from the
+first run, with its stages wrapped in timers. Output files go to a temporary
+folder.
+"""
+
+import argparse
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import types
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Occurrences of part components in each cabinet component
+PARTS_PER_CABINET = 10
+
+# Board sizes in cm (length, width, thickness) the synthetic parts are drawn from
+BOARD_SIZES = [
+    (76.2, 59.055, 1.905), (60.96, 8.89, 1.905), (91.44, 30.48, 1.905), (45.72, 11.43, 1.905),
+    (76.2, 60.96, 0.635), (121.92, 4.445, 1.905), (30.48, 30.48, 1.27), (182.88, 13.97, 3.81),
+]
+
+MATERIALS = ['Plywood', 'Oak', 'Maple', 'MDF']
+
+# Stages of run() that are timed, by the module function that implements them
+STAGES = [
+    ('load cache', 'load_dimension_cache'),
+    ('instances', 'component_instance_counts'),
+    ('measure', 'get_body_dimensions'),
+    ('save cache', 'save_dimension_cache'),
+    ('group', 'cut_rows'),
+    ('write', 'writers.write_table'),
+    ('stock plan', 'plan_stock'),
+    ('nest plan', 'plan_sheets'),
+]
+
+api_calls = Counter()
+
+
+class _FakeApiObject:
+    # Counts every public attribute read as one API call
+    def __getattribute__(self, name):
+        if not name.startswith('_'):
+            api_calls[type(self).__name__ + '.' + name] += 1
+        return object.__getattribute__(self, name)
+
+
+class Point3D(_FakeApiObject):
+    def __init__(self, x, y, z):
+        self.x, self.y, self.z = x, y, z
+
+
+class BoundingBox3D(_FakeApiObject):
+    def __init__(self, points):
+        self.minPoint = Point3D(*(min(point[k] for point in points) for k in range(3)))
+        self.maxPoint = Point3D(*(max(point[k] for point in points) for k in range(3)))
+
+
+class TriangleMesh(_FakeApiObject):
+    def __init__(self, points):
+        self.nodeCoordinatesAsDouble = [value for point in points for value in point]
+
+
+class MeshCalculator(_FakeApiObject):
+    def __init__(self, points):
+        self._points = points
+
+    def setQuality(self, quality):
+        pass
+
+    def calculate(self):
+        return TriangleMesh(self._points)
+
+
+class MeshManager(_FakeApiObject):
+    def __init__(self, points):
+        self._points = points
+
+    def createMeshCalculator(self):
+        return MeshCalculator(self._points)
+
+
+class Named(_FakeApiObject):
+    def __init__(self, name):
+        self.name = name
+
+
+class Vertices(_FakeApiObject):
+    def __init__(self, count):
+        self.count = count
+
+
+class BRepBody(_FakeApiObject):
+    def __init__(self, token, name, size, rotation, material):
+        length, width, thickness = size
+        corners = [(x, y, z) for x in (0, length) for y in (0, width) for z in (0, thickness)]
+        points = [tuple(sum(rotation[i][k] * corner[k] for k in range(3)) for i in range(3)) for corner in corners]
+        self.entityToken = token
+        self.name = name
+        self.boundingBox = BoundingBox3D(points)
+        self.meshManager = MeshManager(points)
+        self.volume = length * width * thickness
+        self.area = 2 * (length * width + length * thickness + width * thickness)
+        self.vertices = Vertices(8)
+        self.material = Named(material)
+        self.appearance = Named(material + ' - Natural')
+
+
+class Occurrence(_FakeApiObject):
+    def __init__(self, component):
+        self.component = component
+
+
+class Component(_FakeApiObject):
+    def __init__(self, component_id, name):
+        self.id = component_id
+        self.name = name
+        self.occurrences = []
+        self.bRepBodies = []
+
+
+class Design(_FakeApiObject):
+    def __init__(self, root_component):
+        self.rootComponent = root_component
+
+
+class UserInterface(_FakeApiObject):
+    def __init__(self):
+        self.messages = []
+
+    def inputBox(self, prompt, title, default_value):
+        return default_value, False
+
+    def messageBox(self, text, *args):
+        self.messages.append(text)
+
+
+class Application(_FakeApiObject):
+    _instance = None
+
+    def __init__(self):
+        self.userInterface = UserInterface()
+        self.activeProduct = None
+        self.logs = []
+
+    @staticmethod
+    def get():
+        if Application._instance is None:
+            Application._instance = Application()
+        return Application._instance
+
+    def log(self, text):
+        self.logs.append(text)
+
+
+def install_fake_adsk():
+    """Put fake adsk, adsk.core and adsk.fusion modules into sys.modules."""
+    adsk = types.ModuleType('adsk')
+    core = types.ModuleType('adsk.core')
+    fusion = types.ModuleType('adsk.fusion')
+    core.Application = Application
+    fusion.TriangleMeshQualityOptions = types.SimpleNamespace(LowQualityTriangleMesh=0)
+    adsk.core = core
+    adsk.fusion = fusion
+    sys.modules.update({'adsk': adsk, 'adsk.core': core, 'adsk.fusion': fusion})
+
+
+def build_design(body_count, unique_fraction=0.1, seed=0):
+    """Return a fake design whose occurrence tree holds about body_count bodies."""
+    generator = random.Random(seed)
+    part_count = max(1, int(body_count * unique_fraction))
+    parts = []
+    for index in range(part_count):
+        part = Component(f'part{index}', f'Part {index}')
+        size = generator.choice(BOARD_SIZES)
+        part.bRepBodies.append(BRepBody(f'body{index}', 'Body1', size, _random_rotation(generator),
+                                        generator.choice(MATERIALS)))
+        parts.append(part)
+
+    cabinets = []
+    for index in range(max(1, part_count // PARTS_PER_CABINET)):
+        cabinet = Component(f'cabinet{index}', f'Cabinet {index}')
+        cabinet.occurrences = [Occurrence(generator.choice(parts)) for _ in range(PARTS_PER_CABINET)]
+        cabinets.append(cabinet)
+
+    root = Component('root', 'Root')
+    root.occurrences = [Occurrence(cabinets[index % len(cabinets)])
+                        for index in range(max(1, body_count // PARTS_PER_CABINET))]
+    return Design(root)
+
+
+def run_benchmark(cut_list, design, output_dir):
+    """Run the script once and return (stage seconds, API call counts)."""
+    timings = Counter()
+    originals = []
+    for stage, name in STAGES:
+        owner = cut_list
+        attribute = name
+        if '.' in name:
+            module_name, attribute = name.split('.')
+            owner = getattr(cut_list, module_name)
+        original = getattr(owner, attribute)
+        originals.append((owner, attribute, original))
+        setattr(owner, attribute, _timed(original, stage, timings))
+
+    app = Application.get()
+    app.activeProduct = design
+    app.userInterface.messages = []
+    cut_list.__file__ = os.path.join(output_dir, 'CutList.py')
+    api_calls.clear()
+    start = time.perf_counter()
+    try:
+        cut_list.run('')
+    finally:
+        for owner, attribute, original in originals:
+            setattr(owner, attribute, original)
+    timings['total'] = time.perf_counter() - start
+
+    if app.logs:
+        raise RuntimeError(app.logs[-1])
+    return timings, Counter(api_calls)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m CutList.benchmark', description='Benchmark the cut list script.')
+    parser.add_argument('--bodies', type=int, nargs='+', default=[1000, 10000, 100000], help='bodies per assembly')
+    parser.add_argument('--unique', type=float, default=0.1, help='fraction of bodies that are distinct parts')
+    parser.add_argument('--top-calls', type=int, default=5, help='most frequent API calls to list')
+    arguments = parser.parse_args(argv)
+
+    install_fake_adsk()
+    from . import CutList as cut_list
+
+    header = ['bodies', 'parts', 'run'] + [stage for stage, _ in STAGES] + ['total', 'API calls']
+    rows = [header]
+    call_reports = []
+    for body_count in arguments.bodies:
+        design = build_design(body_count, arguments.unique)
+        part_count = max(1, int(body_count * arguments.unique))
+        output_dir = tempfile.mkdtemp(prefix='cut_list_benchmark_')
+        try:
+            for run_name in ('cold', 'warm'):
+                if run_name == 'cold':
+                    cut_list._dimension_cache = {}
+                timings, calls = run_benchmark(cut_list, design, output_dir)
+                rows.append([str(body_count), str(part_count), run_name] +
+                            [f'{timings[stage]:.3f}' for stage, _ in STAGES] +
+                            [f"{timings['total']:.3f}", str(sum(calls.values()))])
+                call_reports.append((body_count, run_name, calls))
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+    print('Seconds per stage' + ('' if np is not None else ' (NumPy not installed, world-axis boxes)'))
+    for row in rows:
+        print('  '.join(cell.rjust(width) for cell, width in zip(row, widths)))
+    print()
+    print('Most frequent API calls')
+    for body_count, run_name, calls in call_reports:
+        top = ', '.join(f'{name} {count}' for name, count in calls.most_common(arguments.top_calls))
+        print(f'{body_count} {run_name}: {top}')
+    return 0
+
+
+def _timed(function, stage, timings):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings[stage] += time.perf_counter() - start
+    return wrapper
+
+
+def _random_rotation(generator):
+    # Rotation matrix from a random unit quaternion
+    u1, u2, u3 = generator.random(), generator.random(), generator.random()
+    a = math.sqrt(1 - u1) * math.sin(2 * math.pi * u2)
+    b = math.sqrt(1 - u1) * math.cos(2 * math.pi * u2)
+    c = math.sqrt(u1) * math.sin(2 * math.pi * u3)
+    d = math.sqrt(u1) * math.cos(2 * math.pi * u3)
+    return [
+        [1 - 2 * (c * c + d * d), 2 * (b * c - a * d), 2 * (b * d + a * c)],
+        [2 * (b * c + a * d), 1 - 2 * (b * b + d * d), 2 * (c * d - a * b)],
+        [2 * (b * d - a * c), 2 * (c * d + a * b), 1 - 2 * (b * b + c * c)],
+    ]
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Oriented bounding boxes of point clouds.
+
+Used by the cut list to measure parts whatever their orientation, both from
+Fusion bodies and from exported mesh files. The functions need NumPy, but
+the module can be imported without it. This module does not use the Fusion
+API.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Upper bound on the refinement passes of the oriented bounding box search
+MAX_BOX_REFINEMENTS = 8
+
+
+def oriented_box_extents(points):
+    """Return the three edge lengths of a minimum volume box around the points.
+
+    The principal axes of the points seed the search. Keeping one axis of the
+    current box fixed, the points are projected onto the perpendicular plane
+    and the minimum area rectangle of their convex hull is found with rotating
+    calipers. The best of the three becomes the new box and the search repeats
+    until the volume stops shrinking.
+    """
+    points = np.unique(points, axis=0)
+    if len(points) < 4:
+        return np.ptp(points, axis=0) if len(points) else np.zeros(3)
+
+    centered = points - points.mean(axis=0)
+    _, axes = np.linalg.eigh(np.cov(centered, rowvar=False))
+    extents = np.ptp(centered @ axes, axis=0)
+    volume = np.prod(extents)
+
+    for _ in range(MAX_BOX_REFINEMENTS):
+        best = None
+        for k in range(3):
+            fixed = axes[:, k]
+            plane_axes = np.delete(axes, k, axis=1)
+            width, depth, angle = min_area_rectangle(centered @ plane_axes)
+            candidate_volume = width * depth * np.ptp(centered @ fixed)
+            if best is None or candidate_volume < best[0]:
+                # Rotate the two plane axes onto the rectangle's sides
+                rotated = plane_axes @ np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+                best = (candidate_volume, np.column_stack([rotated, fixed]))
+        if best[0] >= volume * (1 - 1e-9):
+            break
+        volume, axes = best
+        extents = np.ptp(centered @ axes, axis=0)
+    return extents
+
+
+def min_area_rectangle(points):
+    """Return the side lengths of the minimum area rectangle around 2D points."""
+    hull = convex_hull(points)
+    if len(hull) < 3:
+        extent = np.ptp(points, axis=0)
+        return extent[0], extent[1], 0.0
+
+    # One of the rectangle's sides is collinear with a hull edge, so try them all at once
+    edges = np.roll(hull, -1, axis=0) - hull
+    angles = np.unique(np.mod(np.arctan2(edges[:, 1], edges[:, 0]), np.pi / 2))
+    cosines = np.cos(angles)
+    sines = np.sin(angles)
+    along = np.outer(cosines, hull[:, 0]) + np.outer(sines, hull[:, 1])
+    across = np.outer(-sines, hull[:, 0]) + np.outer(cosines, hull[:, 1])
+    widths = along.max(axis=1) - along.min(axis=1)
+    depths = across.max(axis=1) - across.min(axis=1)
+    best = np.argmin(widths * depths)
+    return widths[best], depths[best], angles[best]
+
+
+def convex_hull(points):
+    """Return the convex hull of 2D points in counter-clockwise order (monotone chain)."""
+    # Drop the points strictly inside the octagon of extreme points first (Akl-Toussaint)
+    directions = np.array([[1, 0], [1, 1], [0, 1], [-1, 1], [-1, 0], [-1, -1], [0, -1], [1, -1]], dtype=np.float64)
+    extremes = np.argmax(points @ directions.T, axis=0)
+    _, first = np.unique(extremes, return_index=True)
+    octagon = points[extremes[np.sort(first)]]
+    if len(octagon) >= 3:
+        edges = np.roll(octagon, -1, axis=0) - octagon
+        offsets = points[:, np.newaxis, :] - octagon[np.newaxis, :, :]
+        inside = np.all(edges[:, 0] * offsets[:, :, 1] - edges[:, 1] * offsets[:, :, 0] > 0, axis=1)
+        points = points[~inside]
+
+    order = np.lexsort((points[:, 1], points[:, 0]))
+    ordered = [tuple(point) for point in points[order]]
+
+    def half_hull(sequence):
+        hull = []
+        for point in sequence:
+            while len(hull) >= 2 and ((hull[-1][0] - hull[-2][0]) * (point[1] - hull[-2][1]) -
+                                      (hull[-1][1] - hull[-2][1]) * (point[0] - hull[-2][0])) <= 0:
+                hull.pop()
+            hull.append(point)
+        return hull
+
+    lower = half_hull(ordered)
+    upper = half_hull(reversed(ordered))
+    return np.array(lower[:-1] + upper[:-1])
@@ -0,0 +1,115 @@
+"""Grouping of measured parts into cut list rows.
+
+Parts are keyed by (material, width, height, length), so parts of different
+materials never share a row. Shared by the Fusion script and the offline
+mode. This module does not use the Fusion API.
+"""
+
+import math
+from collections import defaultdict
+from itertools import product
+
+# Columns of the cut list, in output order
+CUT_LIST_FIELDS = ['QTY', 'Material', 'Material Width', 'Material Height', 'Body Name', 'Component Name',
+                   'Length to Cut', 'Spread', 'Appearance', 'Components']
+
+# Offsets of a grid cell and its 26 neighbours
+_NEIGHBOUR_CELLS = list(product((-1, 0, 1), repeat=3))
+
+
+def add_cut(cut_counts, cut_details, dimensions, body_name, component_name, quantity=1, material='', appearance=''):
+    """Count quantity parts of the given material and dimensions, sorted longest first."""
+    length = dimensions[0]  # Longest dimension
+    width = dimensions[1]   # Second longest
+    height = dimensions[2]  # Shortest
+
+    # Create a key for identical cuts of the same material
+    cut_key = (material, width, height, length)
+
+    # Store the details for this cut (only if we haven't seen these dimensions before)
+    details = cut_details.get(cut_key)
+    if details is None:
+        details = cut_details[cut_key] = {
+            'Material': material,
+            'Material Width': width,
+            'Material Height': height,
+            'Length to Cut': length,
+            'Body Name': body_name,
+            'Component Name': component_name,
+            'Appearance': set(),
+            'Components': set(),
+        }
+    # Remember every component and appearance that contributes to the cut
+    details['Components'].add(component_name)
+    if appearance:
+        details['Appearance'].add(appearance)
+    cut_counts[cut_key] += quantity
+
+
+def group_cuts(cut_counts, tolerance):
+    """Cluster (material, width, height, length) cut keys whose sizes are within tolerance.
+
+    Keys are visited largest first and each joins the first group leader of
+    the same material within tolerance in every dimension, or leads a new
+    group. Leaders are indexed in a grid of tolerance-sized cells, so only the
+    27 cells around a key are searched. Comparing against leaders rather than
+    any member keeps groups from chaining into sizes far apart.
+
+    Returns a list of groups with the member keys, the total quantity, the
+    representative size (the largest of each dimension, so every part can be
+    cut from it) and the spread (the largest size difference within the group).
+    """
+    leaders = defaultdict(list)
+    groups = []
+    for cut_key in sorted(cut_counts, key=lambda key: (key[0], key[3], key[1], key[2]), reverse=True):
+        group = None
+        if tolerance > 0:
+            material, width, height, length = cut_key
+            cell = (math.floor(width / tolerance), math.floor(height / tolerance), math.floor(length / tolerance))
+            for dx, dy, dz in _NEIGHBOUR_CELLS:
+                for candidate in leaders.get((material, cell[0] + dx, cell[1] + dy, cell[2] + dz), ()):
+                    _, leader_width, leader_height, leader_length = candidate['keys'][0]
+                    if (abs(leader_width - width) <= tolerance and abs(leader_height - height) <= tolerance and
+                            abs(leader_length - length) <= tolerance):
+                        group = candidate
+                        break
+                if group:
+                    break
+        if group is None:
+            group = {'keys': [], 'quantity': 0}
+            groups.append(group)
+            if tolerance > 0:
+                leaders[(material,) + cell].append(group)
+        group['keys'].append(cut_key)
+        group['quantity'] += cut_counts[cut_key]
+
+    for group in groups:
+        sizes = [cut_key[1:] for cut_key in group['keys']]
+        group['representative'] = tuple(max(values) for values in zip(*sizes))
+        group['spread'] = round(max(max(values) - min(values) for values in zip(*sizes)), 4)
+    return groups
+
+
+def cut_rows(cut_counts, cut_details, tolerance):
+    """Return one cut list row per group of cuts within tolerance.
+
+    cut_details maps each cut key to the row fields of the first part seen
+    with it. Names come from the group's largest part and the sizes fit every
+    part in the group. Appearance and Components list every appearance and
+    component name of the parts in the group.
+    """
+    rows = []
+    for group in group_cuts(cut_counts, tolerance):
+        row = cut_details[group['keys'][0]].copy()
+        width, height, length = group['representative']
+        row.update({
+            'QTY': group['quantity'],
+            'Material Width': width,
+            'Material Height': height,
+            'Length to Cut': length,
+            'Spread': group['spread'],
+            'Appearance': sorted(set().union(*(cut_details[key]['Appearance'] for key in group['keys']))),
+            'Components': sorted(set().union(*(cut_details[key]['Components'] for key in group['keys']))),
+        })
+        rows.append(row)
+    return rows
@@ -0,0 +1,129 @@
+"""Two-dimensional nesting of sheet parts for the cut list.
+
+Rectangular parts are packed onto standard sheets with the MaxRects
+algorithm: every sheet keeps the list of maximal free rectangles left
+after the parts placed so far, and a part goes into the free rectangle
+that leaves the shortest leftover side (best short side fit). Free
+rectangles contained in another one are pruned after every placement,
+which keeps the list short.
+
+Each part is inflated by one saw kerf in both directions and each sheet
+by one kerf, so neighbouring parts are always a kerf apart. Parts whose
+grain matters keep their length along the sheet's length; the others may
+also be placed rotated.
+
+This module does not use the Fusion API.
+"""
+
+# Standard sheet in inches (width, length)
+SHEET_SIZE = (48.0, 96.0)
+
+# Width of the saw cut in inches
+DEFAULT_KERF = 0.125
+
+
+class Sheet:
+    """One sheet with its placed parts and maximal free rectangles."""
+
+    def __init__(self, width, length, kerf):
+        self.kerf = kerf
+        self.placements = []
+        # Free rectangles as (x, y, width, length)
+        self.free = [(0.0, 0.0, width + kerf, length + kerf)]
+
+    def find(self, width, length, rotatable):
+        """Return (score, x, y, rotated) of the best free position, or None."""
+        best = None
+        options = [(width + self.kerf, length + self.kerf, False)]
+        if rotatable and width != length:
+            options.append((length + self.kerf, width + self.kerf, True))
+        for free_x, free_y, free_width, free_length in self.free:
+            for part_width, part_length, rotated in options:
+                if part_width <= free_width and part_length <= free_length:
+                    leftover = min(free_width - part_width, free_length - part_length)
+                    score = (leftover, max(free_width - part_width, free_length - part_length))
+                    if best is None or score < best[0]:
+                        best = (score, free_x, free_y, rotated)
+        return best
+
+    def place(self, part, x, y, rotated):
+        """Place part = (width, length, label) at (x, y) and update the free rectangles."""
+        width, length, label = part
+        if rotated:
+            width, length = length, width
+        self.placements.append({'x': x, 'y': y, 'width': width, 'length': length, 'rotated': rotated, 'label': label})
+
+        used = (x, y, width + self.kerf, length + self.kerf)
+        free = []
+        for rectangle in self.free:
+            free.extend(_split(rectangle, used) if _overlaps(rectangle, used) else [rectangle])
+        self.free = _prune(free)
+
+    def used_area(self):
+        return sum(placement['width'] * placement['length'] for placement in self.placements)
+
+
+def nest_parts(parts, sheet_size=SHEET_SIZE, kerf=DEFAULT_KERF):
+    """Nest (width, length, label, rotatable) parts onto as few sheets as possible.
+
+    Parts are placed largest first on the first open sheet with room.
+    Returns (sheets, oversize) where oversize lists the parts that fit on no sheet.
+    """
+    sheet_width, sheet_length = sheet_size
+    sheets = []
+    oversize = []
+    for width, length, label, rotatable in sorted(parts, key=lambda part: (part[0] * part[1], part[1]), reverse=True):
+        fits = width <= sheet_width and length <= sheet_length
+        if not fits and not (rotatable and length <= sheet_width and width <= sheet_length):
+            oversize.append((width, length, label, rotatable))
+            continue
+        for sheet in sheets:
+            position = sheet.find(width, length, rotatable)
+            if position:
+                break
+        else:
+            sheet = Sheet(sheet_width, sheet_length, kerf)
+            sheets.append(sheet)
+            position = sheet.find(width, length, rotatable)
+        _, x, y, rotated = position
+        sheet.place((width, length, label), x, y, rotated)
+    return sheets, oversize
+
+
+def sheet_yield(sheets, sheet_size=SHEET_SIZE):
+    """Return the fraction of the sheets' area covered by parts."""
+    if not sheets:
+        return 0.0
+    return sum(sheet.used_area() for sheet in sheets) / (len(sheets) * sheet_size[0] * sheet_size[1])
+
+
+def _overlaps(a, b):
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+def _split(free, used):
+    # Maximal rectangles of free that lie outside used
+    x, y, width, length = free
+    used_x, used_y, used_width, used_length = used
+    pieces = []
+    if used_x > x:
+        pieces.append((x, y, used_x - x, length))
+    if used_x + used_width < x + width:
+        pieces.append((used_x + used_width, y, x + width - used_x - used_width, length))
+    if used_y > y:
+        pieces.append((x, y, width, used_y - y))
+    if used_y + used_length < y + length:
+        pieces.append((x, used_y + used_length, width, y + length - used_y - used_length))
+    return pieces
+
+
+def _prune(free):
+    # Drop rectangles contained in another one; larger rectangles are checked first
+    free.sort(key=lambda rectangle: rectangle[2] * rectangle[3], reverse=True)
+    kept = []
+    for rectangle in free:
+        x, y, width, length = rectangle
+        if not any(other[0] <= x and other[1] <= y and x + width <= other[0] + other[2] and
+                   y + length <= other[1] + other[3] for other in kept):
+            kept.append(rectangle)
+    return kept
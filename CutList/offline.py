@@ -0,0 +1,158 @@
+"""Cut lists from folders of exported STL and OBJ files, without Fusion.
+
+Run from the folder that contains CutList:
+
+    python -m CutList.offline exports --units mm --tolerance 0.01
+
+Every file is one part named after the file. Files are parsed and measured
+on a pool of worker processes: binary STL is memory-mapped as a NumPy
+record array, and ASCII STL and OBJ files are read in blocks whose vertex
+lines are converted to arrays a block at a time, so no per-triangle Python
+objects are ever built. Parts are measured by their oriented bounding box
+(or the axis-aligned one with --axis-aligned), grouped exactly like the
+Fusion script does, and written in the same cut list formats. Mesh files
+carry no material, so the Material column stays empty.
+"""
+
+import argparse
+import os
+import struct
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from .geometry import oriented_box_extents
+from .grouping import add_cut, cut_rows, CUT_LIST_FIELDS
+from . import writers
+
+MESH_EXTENSIONS = ('.stl', '.obj')
+
+# Length units of the exported files, in inches per unit
+UNITS = {'mm': 1 / 25.4, 'cm': 1 / 2.54, 'in': 1.0}
+
+# Bytes of an ASCII file read per block
+BLOCK_SIZE = 4 * 1024 * 1024
+
+_STL_TRIANGLE = np.dtype([('normal', '<f4', 3), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+
+
+def read_points(path):
+    """Return the unique vertices of an STL or OBJ file as an (n, 3) array."""
+    if path.lower().endswith('.obj'):
+        points = _read_text_vertices(path, b'v')
+    elif _is_binary_stl(path):
+        triangles = np.memmap(path, dtype=_STL_TRIANGLE, mode='r', offset=84)
+        points = np.unique(np.asarray(triangles['vertices'], dtype=np.float64).reshape(-1, 3), axis=0)
+        del triangles
+    else:
+        points = _read_text_vertices(path, b'vertex')
+    return points
+
+
+def measure_file(job):
+    """Return the dimensions of one part in inches, sorted longest first."""
+    path, scale, oriented = job
+    points = read_points(path)
+    if len(points) == 0:
+        return [0.0, 0.0, 0.0]
+    extents = oriented_box_extents(points) if oriented else np.ptp(points, axis=0)
+    return sorted((round(float(extent) * scale, 4) for extent in extents), reverse=True)
+
+
+def mesh_files(folder):
+    """Return the STL and OBJ files in folder and its subfolders."""
+    paths = []
+    for directory, _, filenames in os.walk(folder):
+        for filename in filenames:
+            if filename.lower().endswith(MESH_EXTENSIONS):
+                paths.append(os.path.join(directory, filename))
+    return sorted(paths)
+
+
+def cut_list(paths, units='mm', tolerance=0.01, oriented=True, workers=None):
+    """Measure the files in parallel and return the grouped cut list rows."""
+    jobs = [(path, UNITS[units], oriented) for path in paths]
+    if workers == 1:
+        dimensions = [measure_file(job) for job in jobs]
+    else:
+        # Hand out files in chunks so small parts do not pay one round trip each
+        chunk_size = max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            dimensions = list(executor.map(measure_file, jobs, chunksize=chunk_size))
+
+    cut_counts = defaultdict(int)
+    cut_details = {}
+    for path, part_dimensions in zip(paths, dimensions):
+        name = os.path.splitext(os.path.basename(path))[0]
+        component_name = os.path.basename(os.path.dirname(path))
+        add_cut(cut_counts, cut_details, part_dimensions, name, component_name)
+    return cut_rows(cut_counts, cut_details, tolerance)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m CutList.offline',
+                                     description='Create a cut list from a folder of STL and OBJ files.')
+    parser.add_argument('folder', help='folder with the exported parts')
+    parser.add_argument('--units', choices=sorted(UNITS), default='mm', help='length unit of the files')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='grouping tolerance in inches')
+    parser.add_argument('--axis-aligned', action='store_true', help='measure the world-axis bounding box')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--format', nargs='+', choices=sorted(writers.WRITERS), default=['csv'], help='output formats')
+    parser.add_argument('--output', help='output path without extension (default: cut_list_<timestamp> in the folder)')
+    arguments = parser.parse_args(argv)
+
+    paths = mesh_files(arguments.folder)
+    if not paths:
+        print(f'No STL or OBJ files found in {arguments.folder}', file=sys.stderr)
+        return 1
+
+    rows = cut_list(paths, arguments.units, arguments.tolerance, not arguments.axis_aligned, arguments.workers)
+    output = arguments.output or os.path.join(
+        arguments.folder, f"cut_list_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    outputs = writers.write_table(output, rows, CUT_LIST_FIELDS, arguments.format)
+    print(f"{len(paths)} parts in {len(rows)} groups written to {', '.join(outputs)}")
+    return 0
+
+
+def _is_binary_stl(path):
+    # ASCII files may also start with "solid", so go by the size the header promises
+    size = os.path.getsize(path)
+    if size < 84:
+        return False
+    with open(path, 'rb') as stl_file:
+        stl_file.seek(80)
+        count, = struct.unpack('<I', stl_file.read(4))
+    return size == 84 + 50 * count
+
+
+def _read_text_vertices(path, keyword):
+    # Parse "<keyword> x y z" lines block by block, keeping only unique vertices
+    blocks = []
+    prefix = keyword + b' '
+    remainder = b''
+    with open(path, 'rb') as mesh_file:
+        while True:
+            data = mesh_file.read(BLOCK_SIZE)
+            text = remainder + data
+            if data:
+                cut = text.rfind(b'\n') + 1
+                text, remainder = text[:cut], text[cut:]
+            fields = []
+            for line in text.splitlines():
+                line = line.lstrip()
+                if line.startswith(prefix):
+                    fields.extend(line.split()[1:4])
+            if fields:
+                blocks.append(np.unique(np.array(fields, dtype=np.float64).reshape(-1, 3), axis=0))
+            if not data:
+                break
+    if not blocks:
+        return np.zeros((0, 3))
+    return np.unique(np.concatenate(blocks), axis=0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
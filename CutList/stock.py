@@ -0,0 +1,179 @@
+"""One-dimensional cutting stock optimization for the cut list.
+
+Pieces of one cross-section are packed into stock boards of the available
+lengths. Every piece consumes its length plus one saw kerf, and a board
+holds its length plus one kerf because the last piece needs no cut after it.
+
+Boards are filled at the longest stock length with first-fit decreasing or
+best-fit decreasing, using an index over the remaining space of the open
+boards so both run in O(n log n). Afterwards each board is shortened to
+the shortest stock length its pieces fit in. An optional improvement pass
+then tries to empty the emptiest boards into the space left on the others,
+until a full pass empties none, no plan could use fewer boards, or its time
+budget runs out.
+
+This module does not use the Fusion API.
+"""
+
+import math
+import time
+from bisect import bisect_left, insort
+
+# Stock lengths in inches (8', 10' and 12' boards)
+STOCK_LENGTHS = (96.0, 120.0, 144.0)
+
+# Width of the saw cut in inches
+DEFAULT_KERF = 0.125
+
+FIRST_FIT = 'ffd'
+BEST_FIT = 'bfd'
+
+
+def pack_lengths(pieces, stock_lengths=STOCK_LENGTHS, kerf=DEFAULT_KERF, method=None, time_budget=0.0):
+    """Pack (length, label) pieces into stock boards.
+
+    method is FIRST_FIT, BEST_FIT or None to keep the better of the two.
+    time_budget is the number of seconds the improvement pass may run.
+
+    Returns (boards, oversize) where boards is a list of dicts with the stock
+    length, the (length, label) cuts and the waste, and oversize lists the
+    pieces longer than the longest stock.
+    """
+    longest = max(stock_lengths)
+    fitting = [piece for piece in pieces if piece[0] <= longest]
+    oversize = [piece for piece in pieces if piece[0] > longest]
+    fitting.sort(key=lambda piece: piece[0], reverse=True)
+
+    if method == FIRST_FIT:
+        bins = _first_fit(fitting, longest + kerf, kerf)
+    elif method == BEST_FIT:
+        bins = _best_fit(fitting, longest + kerf, kerf)
+    else:
+        bins = min((_first_fit(fitting, longest + kerf, kerf), _best_fit(fitting, longest + kerf, kerf)),
+                   key=lambda candidate: _total_stock(candidate, stock_lengths, kerf))
+
+    if time_budget > 0:
+        bins = _improve(bins, longest + kerf, kerf, time.perf_counter() + time_budget)
+
+    boards = []
+    for cuts in bins:
+        used = sum(length for length, _ in cuts) + kerf * (len(cuts) - 1)
+        stock = _shortest_stock(used, stock_lengths)
+        boards.append({'stock_length': stock, 'cuts': cuts, 'waste': round(stock - used, 4)})
+    boards.sort(key=lambda board: (-board['stock_length'], board['waste']))
+    return boards, oversize
+
+
+def lower_bound(pieces, stock_lengths=STOCK_LENGTHS, kerf=DEFAULT_KERF):
+    """Return the least total stock length any plan needs, ignoring how boards split."""
+    return sum(length + kerf for length, _ in pieces if length <= max(stock_lengths)) - kerf
+
+
+def _first_fit(pieces, capacity, kerf):
+    # First board with enough room, found in a max segment tree over remaining space
+    size = 1
+    while size < max(len(pieces), 1):
+        size *= 2
+    tree = [0.0] * (2 * size)
+    bins = []
+    for piece in pieces:
+        need = piece[0] + kerf
+        if tree[1] >= need:
+            node = 1
+            while node < size:
+                node = 2 * node if tree[2 * node] >= need else 2 * node + 1
+            index = node - size
+        else:
+            index = len(bins)
+            bins.append([])
+            node = index + size
+            tree[node] = capacity
+        bins[index].append(piece)
+        tree[node] -= need
+        node //= 2
+        while node:
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+            node //= 2
+    return bins
+
+
+def _best_fit(pieces, capacity, kerf):
+    # Board with the least room that still fits, found in a sorted list of remaining space
+    bins = []
+    remaining = []
+    for piece in pieces:
+        need = piece[0] + kerf
+        position = bisect_left(remaining, (need, -1))
+        if position < len(remaining):
+            space, index = remaining.pop(position)
+        else:
+            space, index = capacity, len(bins)
+            bins.append([])
+        bins[index].append(piece)
+        insort(remaining, (space - need, index))
+    return bins
+
+
+def _improve(bins, capacity, kerf, deadline):
+    # Try to empty the emptiest boards into the free space of the others, best
+    # fit first. Stops at the deadline, once a full pass over the boards empties
+    # none of them, or when no plan could use fewer boards.
+    bins = [list(cuts) for cuts in bins]
+    loads = [sum(length + kerf for length, _ in cuts) for cuts in bins]
+    fewest = math.ceil(sum(loads) / capacity - 1e-9)
+    active = set(range(len(bins)))
+
+    # Each board's space exactly as stored in the sorted list, so entries are
+    # found by the same float instead of one recomputed with other rounding
+    spaces = [capacity - load for load in loads]
+    remaining = sorted((space, index) for index, space in enumerate(spaces))
+
+    improved = True
+    while improved and len(active) > fewest and time.perf_counter() < deadline:
+        improved = False
+        for target in sorted(active, key=loads.__getitem__):
+            if len(active) <= fewest or time.perf_counter() >= deadline:
+                break
+            del remaining[bisect_left(remaining, (spaces[target], target))]
+
+            # Move the pieces one by one, remembering the space each board had
+            moves = []
+            for piece in sorted(bins[target], key=lambda piece: piece[0], reverse=True):
+                need = piece[0] + kerf
+                position = bisect_left(remaining, (need, -1))
+                if position == len(remaining):
+                    break
+                space, index = remaining.pop(position)
+                spaces[index] = space - need
+                insort(remaining, (spaces[index], index))
+                moves.append((index, piece, space))
+
+            if len(moves) < len(bins[target]):
+                # Put back the space of the boards in reverse order
+                for index, _, space in reversed(moves):
+                    del remaining[bisect_left(remaining, (spaces[index], index))]
+                    spaces[index] = space
+                    insort(remaining, (space, index))
+                insort(remaining, (spaces[target], target))
+                continue
+
+            for index, piece, _ in moves:
+                bins[index].append(piece)
+                loads[index] += piece[0] + kerf
+            bins[target] = None
+            active.discard(target)
+            improved = True
+
+    bins = [cuts for cuts in bins if cuts is not None]
+    for cuts in bins:
+        cuts.sort(key=lambda piece: piece[0], reverse=True)
+    return bins
+
+
+def _shortest_stock(used, stock_lengths):
+    return min(length for length in stock_lengths if length >= used - 1e-9)
+
+
+def _total_stock(bins, stock_lengths, kerf):
+    return sum(_shortest_stock(sum(length for length, _ in cuts) + kerf * (len(cuts) - 1), stock_lengths)
+               for cuts in bins)
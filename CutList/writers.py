@@ -0,0 +1,132 @@
+"""Cut list output formats.
+
+Every writer takes a path, the table rows (dicts) and the column names, and
+writes all rows in one pass. List values, such as the contributing
+component names, are kept as lists in JSON and joined with "; " elsewhere.
+
+XLSX files are written with openpyxl when it is installed, and otherwise
+with a minimal built-in writer that produces a single plain worksheet.
+This module does not use the Fusion API.
+"""
+
+import csv
+import json
+import zipfile
+from itertools import chain
+from xml.sax.saxutils import escape
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Separator of list values in formats without lists
+LIST_SEPARATOR = '; '
+
+
+def write_csv(path, rows, fields):
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow([_cell(row.get(field, '')) for field in fields])
+
+
+def write_json(path, rows, fields):
+    with open(path, 'w') as jsonfile:
+        json.dump([{field: row.get(field, '') for field in fields} for row in rows], jsonfile, indent=1)
+
+
+def write_xlsx(path, rows, fields):
+    if openpyxl is None:
+        _write_minimal_xlsx(path, rows, fields)
+        return
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Cut List')
+    sheet.append(fields)
+    for row in rows:
+        sheet.append([_cell(row.get(field, '')) for field in fields])
+    workbook.save(path)
+
+
+# Writers by file extension
+WRITERS = {
+    'csv': write_csv,
+    'json': write_json,
+    'xlsx': write_xlsx,
+}
+
+
+def write_table(base_path, rows, fields, formats=('csv',)):
+    """Write the rows to base_path plus the extension of each format; returns the paths."""
+    paths = []
+    for file_format in formats:
+        path = f'{base_path}.{file_format}'
+        WRITERS[file_format](path, rows, fields)
+        paths.append(path)
+    return paths
+
+
+def _cell(value):
+    if isinstance(value, (list, tuple, set)):
+        return LIST_SEPARATOR.join(str(item) for item in value)
+    return value
+
+
+def _column_name(index):
+    # 0 -> A, 25 -> Z, 26 -> AA
+    name = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(ord('A') + remainder) + name
+    return name
+
+
+def _write_minimal_xlsx(path, rows, fields):
+    # Smallest package Excel and LibreOffice accept: one sheet with inline strings
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml',
+                         '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                         '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                         '<Default Extension="xml" ContentType="application/xml"/>'
+                         '<Override PartName="/xl/workbook.xml" '
+                         'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                         '<Override PartName="/xl/worksheets/sheet1.xml" '
+                         'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                         '</Types>')
+        package.writestr('_rels/.rels',
+                         '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                         '<Relationship Id="rId1" Target="xl/workbook.xml" '
+                         'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+                         '</Relationships>')
+        package.writestr('xl/workbook.xml',
+                         '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                         'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                         '<sheets><sheet name="Cut List" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        package.writestr('xl/_rels/workbook.xml.rels',
+                         '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                         '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+                         'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+                         '</Relationships>')
+
+        # The sheet is streamed row by row into the archive
+        with package.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            table = chain([fields], ([row.get(field, '') for field in fields] for row in rows))
+            for number, values in enumerate(table, 1):
+                cells = []
+                for column, value in enumerate(values):
+                    reference = f'{_column_name(column)}{number}'
+                    value = _cell(value)
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        cells.append(f'<c r="{reference}"><v>{value!r}</v></c>')
+                    else:
+                        cells.append(f'<c r="{reference}" t="inlineStr"><is><t>{escape(str(value))}</t></is></c>')
+                sheet.write(f'<row r="{number}">{"".join(cells)}</row>'.encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
@@ -10,6 +10,26 @@ minRadius = 0.1
 maxPosition = 10.0
 minPosition = -10.0
 
+# How sphere positions are chosen: SAMPLER_REJECTION tries uniformly random
+# positions and, once the box gets crowded, fills the remaining gaps by
+# Poisson-disk growth; SAMPLER_POISSON grows the whole set outward from a
+# single sphere (Bridson's Poisson-disk sampling). Both stop when no more
+# spheres fit.
+SAMPLER_POISSON = 'poisson'
+SAMPLER_REJECTION = 'rejection'
+samplerMode = SAMPLER_REJECTION
+
+# Candidates tried around each active sphere before it is retired (Poisson growth)
+candidatesPerSphere = 30
+
+# Failed random positions in a row after which the box counts as crowded and
+# rejection sampling hands over to Poisson-disk growth
+maxRejections = 1000
+
+# Upper bound on grid cells along each axis, which caps the grid's memory
+# when the radii are tiny compared to the box
+maxGridCells = 128
+
 # Global set of event handlers to keep them referenced for the duration of the command
 handlers = []
 app = adsk.core.Application.get()
@@ -70,30 +90,168 @@ def createSphere(centerPoint, radius):
         if ui:
             ui.messageBox('Failed to create the sphere.\n{}'.format(traceback.format_exc()))
 
-def spheresIntersect(center1, radius1, center2, radius2):
-    distance = math.sqrt((center1.x - center2.x) ** 2 + (center1.y - center2.y) ** 2 + (center1.z - center2.z) ** 2)
-    return distance < (radius1 + radius2)
+class SphereGrid:
+    # Uniform grid of the spheres placed between low and high. Each sphere is
+    # stored in every cell its bounding box touches, so two spheres can only
+    # overlap if they share a cell and a new sphere is checked against the
+    # cells it covers. Storing by extent rather than by center keeps small
+    # spheres from piling up in cells sized for the largest radius. Cells are
+    # a flat list indexed by integer, which is cheaper than hashing tuples.
+    def __init__(self, cellSize, low, high):
+        cellSize = max(cellSize, (high - low) / maxGridCells)
+        self.inverse = 1.0 / cellSize
+        self.low = low
+        self.size = int((high - low) * self.inverse) + 2
+        self.plane = self.size * self.size
+        self.cells = [None] * (self.size * self.plane)
 
-def createRandomSpheres():
-    previousSpheres = []
-    for _ in range(numSpheres):
-        while True:
-            radius = random.uniform(minRadius, maxRadius)
-            x = random.uniform(minPosition, maxPosition)
-            y = random.uniform(minPosition, maxPosition)
-            z = random.uniform(minPosition, maxPosition)
-            centerPoint = adsk.core.Point3D.create(x, y, z)
+    def _range(self, value, radius, stride):
+        # Offsets of the cells covering value +- radius along one axis
+        return range(int((value - radius - self.low) * self.inverse) * stride,
+                     (int((value + radius - self.low) * self.inverse) + 1) * stride, stride)
+
+    def intersects(self, x, y, z, radius):
+        # Runs for every candidate, so the cell ranges are worked out inline
+        low = self.low
+        inverse = self.inverse
+        size = self.size
+        plane = self.plane
+        cells = self.cells
+        firstZ = int((z - radius - low) * inverse)
+        lastZ = int((z + radius - low) * inverse) + 1
+        rangeY = range(int((y - radius - low) * inverse) * size, (int((y + radius - low) * inverse) + 1) * size, size)
+        for i in range(int((x - radius - low) * inverse) * plane, (int((x + radius - low) * inverse) + 1) * plane, plane):
+            for j in rangeY:
+                for cell in cells[i + j + firstZ:i + j + lastZ]:
+                    if cell:
+                        for px, py, pz, pr in cell:
+                            dx = x - px
+                            dy = y - py
+                            dz = z - pz
+                            reach = radius + pr
+                            if dx * dx + dy * dy + dz * dz < reach * reach:
+                                return True
+        return False
+
+    def add(self, x, y, z, radius):
+        cells = self.cells
+        sphere = (x, y, z, radius)
+        rangeY = self._range(y, radius, self.size)
+        rangeZ = self._range(z, radius, 1)
+        for i in self._range(x, radius, self.plane):
+            for j in rangeY:
+                for k in rangeZ:
+                    cell = cells[i + j + k]
+                    if cell is None:
+                        cells[i + j + k] = [sphere]
+                    else:
+                        cell.append(sphere)
+
+def createGrid():
+    # Grid over the box grown by the largest radius, so every sphere fits
+    return SphereGrid(minRadius + maxRadius, minPosition - maxRadius, maxPosition + maxRadius)
+
+def placeRandomSpheres():
+    # Pick non-intersecting (x, y, z, radius) spheres by rejection sampling.
+    # After maxRejections failures in a row the box is nearly full, so the
+    # remaining gaps are filled by Poisson-disk growth from the placed spheres.
+    grid = createGrid()
+    spheres = []
+    rejections = 0
+    
+    # Local names keep the loop, which runs many times per sphere once the
+    # box gets crowded, fast
+    rand = random.random
+    intersects = grid.intersects
+    radiusSpan = maxRadius - minRadius
+    positionSpan = maxPosition - minPosition
+    
+    while len(spheres) < numSpheres:
+        if rejections == maxRejections:
+            return placePoissonSpheres(grid, spheres)
+        radius = minRadius + radiusSpan * rand()
+        x = minPosition + positionSpan * rand()
+        y = minPosition + positionSpan * rand()
+        z = minPosition + positionSpan * rand()
+        
+        # Check for intersections with nearby spheres only
+        if intersects(x, y, z, radius):
+            rejections += 1
+        else:
+            grid.add(x, y, z, radius)
+            spheres.append((x, y, z, radius))
+            rejections = 0
+    return spheres
+
+def placePoissonSpheres(grid=None, spheres=None):
+    # Bridson's Poisson-disk sampling with variable radii, growing from the
+    # given spheres or from one random sphere. A random active sphere proposes
+    # candidates in the shell between touching it and twice that distance; the
+    # first candidate that fits the box and overlaps nothing is placed and
+    # becomes active, and a sphere whose candidates all fail is retired. Every
+    # sphere is retired at most once and only finitely many fit in the box, so
+    # the loop always ends.
+    if not spheres:
+        grid = createGrid()
+        radius = random.uniform(minRadius, maxRadius)
+        first = (random.uniform(minPosition, maxPosition), random.uniform(minPosition, maxPosition),
+                 random.uniform(minPosition, maxPosition), radius)
+        grid.add(*first)
+        spheres = [first]
+    active = list(spheres)
+    
+    # Local names keep the candidate loop, which runs about
+    # candidatesPerSphere times per sphere, fast
+    rand = random.random
+    radiusSpan = maxRadius - minRadius
+    cos = math.cos
+    sin = math.sin
+    sqrt = math.sqrt
+    intersects = grid.intersects
+    tau = 2.0 * math.pi
+    candidates = range(candidatesPerSphere)
+    
+    while active and len(spheres) < numSpheres:
+        index = int(rand() * len(active))
+        px, py, pz, pr = active[index]
+        for _ in candidates:
+            radius = minRadius + radiusSpan * rand()
             
-            # Check for intersections with previously created spheres
-            intersects = False
-            for prevCenter, prevRadius in previousSpheres:
-                if spheresIntersect(centerPoint, radius, prevCenter, prevRadius):
-                    intersects = True
-                    break
+            # Uniform random direction and a distance in the shell around the active sphere
+            cosTheta = 2.0 * rand() - 1.0
+            phi = tau * rand()
+            distance = (pr + radius) * (1.0 + rand())
+            planar = distance * sqrt(1.0 - cosTheta * cosTheta)
+            x = px + planar * cos(phi)
+            y = py + planar * sin(phi)
+            z = pz + distance * cosTheta
             
-            if not intersects:
-                previousSpheres.append((centerPoint, radius))
-                createSphere(centerPoint, radius)
+            if (minPosition <= x <= maxPosition and minPosition <= y <= maxPosition and
+                    minPosition <= z <= maxPosition and not intersects(x, y, z, radius)):
+                sphere = (x, y, z, radius)
+                grid.add(*sphere)
+                spheres.append(sphere)
+                active.append(sphere)
                 break
+        else:
+            # Nothing fits around this sphere any more; swap-remove it
+            active[index] = active[-1]
+            active.pop()
+    return spheres
+
+def createRandomSpheres():
+    # Place all spheres first, then build the geometry
+    if samplerMode == SAMPLER_POISSON:
+        spheres = placePoissonSpheres()
+    else:
+        spheres = placeRandomSpheres()
+    
+    for x, y, z, radius in spheres:
+        createSphere(adsk.core.Point3D.create(x, y, z), radius)
+    
+    # Report when the box could not hold the requested number of spheres
+    if len(spheres) < numSpheres and ui:
+        ui.messageBox('Only {} of {} spheres fit between {} and {}.'.format(
+            len(spheres), numSpheres, minPosition, maxPosition))
 
 createRandomSpheres()
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""Regression tests for the cut list stock optimizer (CutList/stock.py)."""
+
+import os
+import random
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from CutList import stock
+
+
+def random_profile(rng):
+    # Random cuts and repeated parts measured in mm and rounded to 1/10000 in
+    # like the cut list rows, which do not add up exactly in floating point
+    pieces = []
+    parts = [rng.uniform(100.0, 2400.0) for _ in range(6)]
+    for label in range(rng.randint(5, 200)):
+        length = rng.uniform(75.0, 2400.0) if rng.random() < 0.5 else rng.choice(parts)
+        pieces.append((round(length / 25.4, 4), 'part{}'.format(label)))
+    return pieces
+
+
+class ImproveTest(unittest.TestCase):
+    def test_random_profiles(self):
+        kerf = stock.DEFAULT_KERF
+        capacity = max(stock.STOCK_LENGTHS) + kerf
+        for seed in range(2000):
+            rng = random.Random(seed)
+            pieces = sorted(random_profile(rng), reverse=True)
+            for packer in (stock._first_fit, stock._best_fit):
+                bins = packer(pieces, capacity, kerf)
+                improved = stock._improve(bins, capacity, kerf, time.perf_counter() + 10.0)
+                self.assertLessEqual(len(improved), len(bins), seed)
+                self.assertEqual(sorted(piece for cuts in improved for piece in cuts), sorted(pieces), seed)
+                for cuts in improved:
+                    self.assertLessEqual(sum(length + kerf for length, _ in cuts), capacity + 1e-9, seed)
+
+
+if __name__ == '__main__':
+    unittest.main()